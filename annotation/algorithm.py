@@ -8,6 +8,50 @@
 
 import logging
 
+def round_half_away(x):
+  """Rounds a numpy array to the nearest integers, with halves rounded away
+  from zero, like the python built-in round() - numpy.round() would round
+  halves to the nearest even number instead."""
+
+  import numpy
+
+  a = numpy.abs(x)
+  r = numpy.floor(a)
+  r += (a - r) >= 0.5
+  return numpy.copysign(r, x)
+
+def linear(keys, values, frames):
+  """Linearly interpolates keypoints at a number of frames.
+
+  Parameters
+
+    keys
+      Sorted numpy array with the numbers of the annotated frames (at least 2)
+
+    values
+      A numpy array with shape (len(keys), keypoints, 2) and the annotations
+      for each of the frames in 'keys'
+
+    frames
+      A numpy array with the numbers of the frames to interpolate, which must
+      lie between keys[0] and keys[-1]
+
+  Returns an integer numpy array with shape (len(frames), keypoints, 2). The
+  results are the same as for interpolate().
+  """
+
+  import numpy
+
+  # index of the keyframe on the left of each frame
+  low = numpy.searchsorted(keys, frames, side='right') - 1
+  low = numpy.minimum(low, len(keys) - 2)
+
+  diff = (keys[low+1] - keys[low]).astype('float64')
+  delta = (values[low+1] - values[low]) / diff[:,None,None]
+  k = (frames - keys[low]).astype('float64')
+
+  return round_half_away(values[low] + (delta * k[:,None,None])).astype(int)
+
 def interpolate(data, length):
   """Interpolates the input keypoints so that between frames present a smooth
   transition.
@@ -23,6 +67,9 @@ def interpolate(data, length):
   Returns 'data', altered so all frames in the input video have annotations.
   """
 
+  import numpy
+  from .keypoints import AnnotationArray
+
   skeys = sorted(data.iterkeys())
   
   if skeys[0] != 0:
@@ -37,13 +84,27 @@ def interpolate(data, length):
     skeys.append(length-1)
     data[length-1] = data[idx]
 
-  intervals = [(skeys[i], skeys[i+1]) for i in range(len(skeys)-1)]
+  if len(skeys) < 2: return data
 
-  for low, high in intervals:
-    diff = high - low # number of points to interpolate
-    delta = [((kp_high[0] - kp_low[0]) / float(diff), (kp_high[1] - kp_low[1]) / float(diff)) for kp_low, kp_high in zip(data[low], data[high])]
-    for k in range(1, diff):
-      data[low+k] = [(int(round(low_x+(delta[index][0]*k))),int(round(low_y+delta[index][1]*k))) for index, (low_x, low_y) in enumerate(data[low])]
+  # all missing frames, for all keypoints, at once
+  keys = numpy.array(skeys)
+  if isinstance(data, AnnotationArray):
+    values = data.points[keys].astype('float64')
+  else:
+    values = numpy.array([data[k] for k in skeys], dtype='float64')
+  frames = numpy.arange(length)
+  frames = frames[numpy.searchsorted(keys, frames) == \
+      numpy.searchsorted(keys, frames, side='right')] #not in keys
+  points = linear(keys, values, frames)
+
+  if isinstance(data, AnnotationArray):
+    if data.frames() < length: data.resize(length)
+    data.points[frames] = points
+    data.mask[frames] = True
+
+  else:
+    for frame, value in zip(frames.tolist(), points.tolist()):
+      data[frame] = [tuple(k) for k in value]
 
   return data
 
@@ -62,18 +123,183 @@ def past_expand(data, length):
   Returns 'data', altered so all frames in the input video have annotations.
   """
 
+  from .keypoints import AnnotationArray
+
   skeys = sorted(data.iterkeys())
   
   if skeys[0] != 0:
     idx = skeys[0]
     logging.info("Frame 0 is not annotated, borrowing from first annotated frame (%d)" % idx)
-    skeys.insert(0,0)
     data[0] = data[idx]
 
+  if isinstance(data, AnnotationArray):
+    # forward-fill: each frame takes the index of the last annotated one
+    import numpy
+    if data.frames() < length: data.resize(length)
+    mask = data.mask[:length]
+    back = numpy.maximum.accumulate(numpy.where(mask,
+      numpy.arange(length), 0))
+    data.points[:length] = data.points[back]
+    mask[:] = True
+    return data
+
+  previous = None
   for key in range(length):
-    if key not in skeys: #borrow annotation from the past
-      back = key - 1
-      while back not in skeys: back -= 1
-      data[key] = data[back]
+    if key in data: previous = data[key]
+    else: data[key] = previous #borrow annotation from the past
 
   return data
+
+def compress(data, tolerance):
+  """Reduces annotations to a minimal set of keyframes, so that interpolating
+  them back reproduces all input frames within a tolerance.
+
+  This is a simplification on the time axis in the style of Ramer-Douglas-
+  Peucker, applied jointly to all keypoints: starting from the first and last
+  annotated frames, the frame that is worst reproduced by interpolating the
+  keyframes around it is promoted to a keyframe, until no frame is off by more
+  than the tolerance.
+
+  Parameters
+
+    data
+      Annotations, typically with many or all frames annotated
+
+    tolerance
+      The maximum allowed (euclidean) distance, in pixels, between any
+      keypoint in the input and the same keypoint after interpolate() is
+      applied to the output
+
+  Returns new annotations of the same type as 'data', containing only the
+  selected keyframes.
+  """
+
+  import numpy
+  from .keypoints import AnnotationArray
+
+  if isinstance(data, AnnotationArray):
+    keys = data.annotated()
+    values = data.points[keys].astype('float64')
+  else:
+    keys = numpy.array(sorted(data.iterkeys()))
+    values = numpy.array([data[k] for k in keys], dtype='float64')
+
+  keep = numpy.zeros((len(keys),), dtype=bool)
+  keep[0] = keep[-1] = True
+
+  intervals = [(0, len(keys)-1)]
+  while intervals:
+    low, high = intervals.pop()
+    if high - low < 2: continue
+    inner = numpy.arange(low+1, high)
+    approx = linear(keys[[low, high]], values[[low, high]], keys[inner])
+    error = numpy.sqrt(((approx - values[inner])**2).sum(axis=2)).max(axis=1)
+    worst = error.argmax()
+    if error[worst] > tolerance:
+      keep[inner[worst]] = True
+      intervals.append((low, inner[worst]))
+      intervals.append((inner[worst], high))
+
+  kept = keys[keep]
+
+  if isinstance(data, AnnotationArray):
+    retval = AnnotationArray(data.frames(), data.points.shape[1], data.header,
+        data.points.dtype)
+    retval.points[kept] = data.points[kept]
+    retval.mask[kept] = True
+    return retval
+
+  return dict((k, data[k]) for k in kept.tolist())
+
+class InterpolatedView(object):
+  """A read-only view of sparse annotations that behaves as if interpolate()
+  or past_expand() had been applied to them, computing frames only when they
+  are requested.
+
+  Only the sorted list of annotated frames is kept besides the annotations
+  themselves, so memory use depends on the number of keyframes and not on the
+  video length. Random access (view[k]) uses a binary search to find the
+  keyframes around 'k', while iter() walks them in order.
+  """
+
+  def __init__(self, data, length, method='interpolate'):
+    """Creates a new view.
+
+    Parameters
+
+      data
+        Annotations, with at least one annotated frame. They are not copied,
+        so changes to the annotated frames are reflected on the view, as long
+        as no frames are added or removed.
+
+      length
+        Total duration of video in number of frames
+
+      method
+        Either 'interpolate' or 'expand', to get the same results as
+        interpolate() or past_expand() respectively
+    """
+
+    if method not in ('interpolate', 'expand'):
+      raise RuntimeError, "unknown method '%s' - use 'interpolate' or 'expand'" % method
+
+    self.data = data
+    self.length = length
+    self.method = method
+    self.keys = sorted(data.iterkeys())
+
+  def compute(self, key, low, high):
+    """Computes frame 'key' given the keyframes on its left ('low') and on its
+    right ('high'), any of which may be None at the edges of the video."""
+
+    if low is None: return self.data[high] #borrowed at the start
+    if high is None or self.method == 'expand': return self.data[low]
+
+    diff = high - low
+    k = key - low
+    return [(int(round(low_x+(((high_x - low_x) / float(diff))*k))),
+      int(round(low_y+((high_y - low_y) / float(diff))*k))) for 
+      (low_x, low_y), (high_x, high_y) in zip(self.data[low], self.data[high])]
+
+  def __getitem__(self, key):
+
+    if key < 0: key = self.length + key
+    if not (0 <= key < self.length):
+      raise IndexError, "view only has %d frames" % self.length
+
+    import bisect
+
+    i = bisect.bisect_right(self.keys, key)
+    if i and self.keys[i-1] == key: return self.data[key]
+
+    low = self.keys[i-1] if i else None
+    high = self.keys[i] if i < len(self.keys) else None
+    return self.compute(key, low, high)
+
+  def iter(self, start=0, stop=None):
+    """Yields the annotations for all frames in the range [start, stop)"""
+
+    import bisect
+
+    if stop is None: stop = self.length
+    i = bisect.bisect_right(self.keys, start)
+
+    for key in xrange(max(start, 0), min(stop, self.length)):
+      while i < len(self.keys) and self.keys[i] <= key: i += 1
+      if i and self.keys[i-1] == key: 
+        yield self.data[key]
+      else:
+        yield self.compute(key, self.keys[i-1] if i else None,
+            self.keys[i] if i < len(self.keys) else None)
+
+  def __iter__(self):
+    return self.iter()
+
+  def __len__(self):
+    return self.length
+
+  def __contains__(self, key):
+    return 0 <= key < self.length
+
+  def has_key(self, key):
+    return key in self
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Andre Anjos <andre.anjos@idiap.ch>
+# Mon 30 Jul 2012 18:05:47 CEST
+
+"""Times the startup of each program with ``--help`` and checks it loads none
+of the heavy packages, which should only be imported on the code paths that
+need them. Each program runs on a fresh interpreter a number of times and the
+best time is reported.
+
+Run it with ``python -m annotation.benchmark.imports``. The exit status is 1
+if any program loads a heavy package or takes longer than ``--max-time``, so
+this can guard against regressions.
+"""
+
+import os
+import sys
+import time
+import subprocess
+
+PROGRAMS = ('annotate', 'replay', 'postproc', 'mktest', 'framestore')
+HEAVY = ('bob', 'PIL', 'numpy')
+
+# runs a program with --help and reports which heavy packages it loaded
+CHILD = """
+import sys, StringIO
+sys.argv = ['%(program)s.py', '--help']
+stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+try:
+  from annotation.video.script.%(program)s import main
+  main()
+except SystemExit:
+  pass
+sys.stdout = stdout
+print ' '.join([k for k in %(heavy)r if k in sys.modules])
+"""
+
+def run(program):
+  """Runs the program once, returning the time it took and the heavy
+  packages it loaded"""
+
+  root = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))))
+  start = time.time()
+  output = subprocess.check_output([sys.executable, '-c',
+    CHILD % {'program': program, 'heavy': HEAVY}], cwd=root)
+  return time.time() - start, output.split()
+
+def process_arguments():
+
+  import argparse
+
+  parser = argparse.ArgumentParser(description=__doc__,
+      formatter_class=argparse.RawDescriptionHelpFormatter)
+
+  parser.add_argument('-r', '--repeat', dest='repeat', metavar='N',
+      type=int, default=5,
+      help="Number of times each program is started (defaults to %(default)s)")
+
+  parser.add_argument('-m', '--max-time', dest='max_time', metavar='SECONDS',
+      type=float, default=0.5,
+      help="Longest acceptable startup time, in seconds (defaults to %(default)s)")
+
+  return parser.parse_args()
+
+def main():
+
+  args = process_arguments()
+
+  failed = False
+
+  for program in PROGRAMS:
+    best, loaded = min(run(program) for k in range(args.repeat))
+    problems = []
+    if loaded: problems.append('loads %s' % ', '.join(loaded))
+    if best > args.max_time: problems.append('too slow')
+    failed = failed or bool(problems)
+    sys.stdout.write("%-12s %.3fs %s\n" % (program, best,
+      '; '.join(problems) or 'OK'))
+    sys.stdout.flush()
+
+  sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+  main()
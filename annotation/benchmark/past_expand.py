@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Andre Anjos <andre.anjos@idiap.ch>
+# Mon 30 Jul 2012 17:40:31 CEST
+
+"""Times algorithm.past_expand() against video length and the gap between
+annotated frames, for dictionaries and AnnotationArray containers, next to
+the original implementation that walked back frame by frame.
+
+Run it with ``python -m annotation.benchmark.past_expand``.
+"""
+
+import sys
+import time
+
+def reference_past_expand(data, length):
+  """The original implementation of algorithm.past_expand()"""
+
+  skeys = sorted(data.iterkeys())
+
+  if skeys[0] != 0:
+    skeys.insert(0,0)
+    data[0] = data[skeys[1]]
+
+  for key in range(length):
+    if key not in skeys: #borrow annotation from the past
+      back = key - 1
+      while back not in skeys: back -= 1
+      data[key] = data[back]
+
+  return data
+
+def sparse(length, gap, keypoints=4):
+  """Returns annotations for one in every 'gap' frames"""
+
+  return dict((k, [(k, k)] * keypoints) for k in range(0, length, gap))
+
+def timed(function, data, length):
+  """Returns the time, in seconds, 'function' takes to expand 'data'"""
+
+  start = time.time()
+  function(data, length)
+  return time.time() - start
+
+def process_arguments():
+
+  import argparse
+
+  parser = argparse.ArgumentParser(description=__doc__,
+      formatter_class=argparse.RawDescriptionHelpFormatter)
+
+  parser.add_argument('-l', '--lengths', dest='lengths', metavar='N',
+      type=int, nargs='+', default=[1000, 10000, 100000],
+      help="Video lengths to try, in frames (defaults to %(default)s)")
+
+  parser.add_argument('-g', '--gaps', dest='gaps', metavar='N',
+      type=int, nargs='+', default=[1, 10, 100],
+      help="Gaps between annotated frames to try (defaults to %(default)s)")
+
+  parser.add_argument('-r', '--reference-limit', dest='limit', metavar='N',
+      type=int, default=10000,
+      help="Longest video to time the original implementation on, as it is quadratic (defaults to %(default)s)")
+
+  return parser.parse_args()
+
+def main():
+
+  from ..algorithm import past_expand
+  from ..keypoints import AnnotationArray
+
+  args = process_arguments()
+
+  sys.stdout.write("%8s %6s %12s %12s %12s\n" % ('length', 'gap',
+    'original', 'dict', 'array'))
+
+  for length in args.lengths:
+    for gap in args.gaps:
+      data = sparse(length, gap)
+
+      original = '-'
+      if length <= args.limit:
+        original = '%.4fs' % timed(reference_past_expand, dict(data), length)
+      dictionary = '%.4fs' % timed(past_expand, dict(data), length)
+      array = '%.4fs' % timed(past_expand, AnnotationArray.from_dict(data),
+          length)
+
+      sys.stdout.write("%8d %6d %12s %12s %12s\n" % (length, gap, original,
+        dictionary, array))
+      sys.stdout.flush()
+
+if __name__ == '__main__':
+  main()
@@ -6,18 +6,28 @@
 """A set of utilities and library functions to handle keypoint annotations."""
 
 import os
+import struct
 
-def save(data, fp, header=None, backup=False, fs=" "):
+# binary format: magic, version, frames, keypoints and label block size,
+# followed by the labels (new-line separated, padded to a multiple of 8
+# bytes), the (frames, keypoints, 2) little-endian int32 coordinates and the
+# uint8 frame mask
+BINARY_MAGIC = 'ANNB'
+BINARY_VERSION = 1
+BINARY_HEADER = '<4sIIII'
+
+def save(data, fp, header=None, backup=False, fs=" ", binary=False):
   """Saves a given data set to a file
   
   Parameters
 
   data
     A dictionary where the keys are frame numbers and the values are lists of
-    tuples indicating each of the keypoints in (x, y)
+    tuples indicating each of the keypoints in (x, y), or an AnnotationArray
 
   fp
-    The name of a file, with full path, to be used for recording the data or an     already opened file-like object, that accepts the "write()" call.
+    The name of a file, with full path, to be used for recording the data or an     already opened file-like object, that accepts the "write()" call. Files
+    given by name are replaced atomically, once completely written.
 
   header
     If set, should be a python iterable with the names of each (double) column
@@ -30,16 +40,38 @@ def save(data, fp, header=None, backup=False, fs=" "):
 
   fs
     The field separator to use. A single space by default.
+
+  binary
+    If set, saves the data in binary format instead of text (see
+    save_binary()). The field separator is ignored in this case.
   """
 
   if isinstance(fp, (str, unicode)):
 
+    # writes a temporary file first and then renames it over the original,
+    # so a half-written file is never left behind at the given path
+    tmpname = fp + '.tmp'
+    try:
+      with open(tmpname, 'wb' if binary else 'wt') as f:
+        save(data, f, header, fs=fs, binary=binary)
+        f.flush()
+        os.fsync(f.fileno())
+    except:
+      if os.path.exists(tmpname): os.unlink(tmpname)
+      raise
+
     if backup and os.path.exists(fp):
       bname = fp + '~'
       if os.path.exists(bname): os.unlink(bname)
-      os.rename(fp, bname)
+      try:
+        os.link(fp, bname) #the original stays in place until replaced
+      except (AttributeError, OSError):
+        os.rename(fp, bname)
+
+    os.rename(tmpname, fp)
+    return
 
-    fp = open(fp, 'wt')
+  if binary: return save_binary(data, fp, header)
 
   frame_tmpl = "%d"
   coord_tmpl = "%d" + fs + "%d"
@@ -48,6 +80,16 @@ def save(data, fp, header=None, backup=False, fs=" "):
   if header is not None:
     fp.write(fs.join(header) + rs)
 
+  from .keypoints import AnnotationArray
+  if isinstance(data, AnnotationArray):
+    import numpy
+    frames = data.annotated()
+    if not len(frames): return #only the header, as for dictionaries
+    rows = numpy.hstack((frames.reshape(-1, 1),
+      data.points[frames].reshape(len(frames), -1)))
+    numpy.savetxt(fp, rows, fmt='%d', delimiter=fs, newline=rs)
+    return
+
   for key in sorted(data.iterkeys()):
 
     fp.write(frame_tmpl % key)
@@ -56,6 +98,201 @@ def save(data, fp, header=None, backup=False, fs=" "):
 
     fp.write(rs)
 
+def save_binary(data, fp, header=None):
+  """Saves a given data set to an already opened file in binary format.
+
+  The binary format has a fixed header with the number of frames and
+  keypoints and the keypoint labels, followed by all coordinates as a packed
+  int32 array and a mask telling which frames are annotated. It can be
+  memory-mapped by load().
+
+  Parameters
+
+  data
+    A dictionary or an AnnotationArray, as for save()
+
+  fp
+    An opened file-like object, that accepts the "write()" call
+
+  header
+    If set, the names of each keypoint. If not set, uses the header of the
+    AnnotationArray, if that is available, or the keypoint indexes.
+  """
+
+  from .keypoints import AnnotationArray
+
+  if not isinstance(data, AnnotationArray):
+    data = AnnotationArray.from_dict(data, header)
+  if header is None: header = data.labels()
+
+  labels = '\n'.join(header)
+  labels += '\0' * (-(struct.calcsize(BINARY_HEADER) + len(labels)) % 8)
+
+  fp.write(struct.pack(BINARY_HEADER, BINARY_MAGIC, BINARY_VERSION,
+    data.points.shape[0], data.points.shape[1], len(labels)))
+  fp.write(labels)
+  fp.write(data.points.astype('<i4').tostring())
+  fp.write(data.mask.astype('uint8').tostring())
+
+def is_binary(fp):
+  """Tells if the given file name or opened file is in binary format. Opened
+  files are checked without changing their current position, if possible."""
+
+  if isinstance(fp, (str, unicode)):
+    with open(fp, 'rb') as f: return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+  try:
+    position = fp.tell()
+    magic = fp.read(len(BINARY_MAGIC))
+    fp.seek(position)
+  except (AttributeError, IOError):
+    return False #not seekable, assume text
+
+  return magic == BINARY_MAGIC
+
+def load_binary(fp):
+  """Loads a data set saved with save_binary(), returning an AnnotationArray.
+
+  If 'fp' is a file name, the coordinates and mask are memory-mapped
+  (copy-on-write: changes are never written back to the file). Otherwise,
+  the contents of the opened file are read into memory.
+
+  Returns the loaded data as a tuple (data, header), like load().
+  """
+
+  import numpy
+  from .keypoints import AnnotationArray
+
+  filename = fp if isinstance(fp, (str, unicode)) else None
+  if filename is not None: fp = open(filename, 'rb')
+
+  size = struct.calcsize(BINARY_HEADER)
+  magic, version, frames, keypoints, nlabels = \
+      struct.unpack(BINARY_HEADER, fp.read(size))
+
+  if magic != BINARY_MAGIC:
+    raise RuntimeError, "input is not a binary annotation file"
+  if version != BINARY_VERSION:
+    raise RuntimeError, "binary annotation file has version %d, but we can only read version %d" % (version, BINARY_VERSION)
+
+  header = fp.read(nlabels).rstrip('\0').split('\n')
+  if len(header) != keypoints:
+    raise RuntimeError, "binary annotation file has %d labels for %d keypoints" % (len(header), keypoints)
+
+  data = AnnotationArray(0, keypoints, header)
+  offset = size + nlabels
+  shape = (frames, keypoints, 2)
+
+  if filename is not None:
+    fp.close()
+    if frames:
+      data.points = numpy.memmap(filename, dtype='<i4', mode='c',
+          offset=offset, shape=shape)
+      data.mask = numpy.memmap(filename, dtype='bool', mode='c',
+          offset=offset + data.points.nbytes, shape=(frames,))
+  else:
+    points = numpy.fromstring(fp.read(4 * frames * keypoints * 2), dtype='<i4')
+    data.points = points.reshape(shape)
+    data.mask = numpy.fromstring(fp.read(frames), dtype='bool')
+
+  return (data, header)
+
+class Journal(object):
+  """An append-only log of changes to annotations.
+
+  Each change is a single line, written and flushed as it happens, so it costs
+  the same regardless of how many annotations exist. A line can either set
+  all keypoints of a frame, as in "S <frame> <x> <y> <x> <y> ...", or delete
+  the annotations of a frame, as in "D <frame>". Once the annotations are
+  completely saved somewhere else, the journal can be cleared. Otherwise, it
+  can be replayed on top of the annotations it started from to recover all
+  changes. The file those annotations were loaded from is recorded on the
+  first line, as in "B <filename>".
+  """
+
+  def __init__(self, filename, base=None):
+    """Opens (or creates) the journal at the given file. If set, 'base' is
+    the name of the file holding the annotations changes are applied to,
+    which is recorded when the journal is (re)started."""
+
+    self.filename = filename
+    self.base = base
+    self.fp = None
+
+  def write(self, line):
+
+    if self.fp is None:
+      started = self.exists()
+      self.fp = open(self.filename, 'at')
+      if not started and self.base is not None:
+        self.fp.write('B %s\n' % os.path.abspath(self.base))
+    self.fp.write(line + '\n')
+    self.fp.flush()
+
+  def set(self, frame, points):
+    """Records that the frame was annotated with the given (x, y) points"""
+
+    self.write(' '.join(['S', str(frame)] + \
+        ['%d %d' % (x, y) for (x, y) in points]))
+
+  def delete(self, frame):
+    """Records that the annotations of the frame were deleted"""
+
+    self.write('D %d' % frame)
+
+  def exists(self):
+    """Tells if there are changes recorded in the journal"""
+
+    return os.path.exists(self.filename) and \
+        os.path.getsize(self.filename) > 0
+
+  def recorded_base(self):
+    """Returns the name of the file the changes in the journal apply to, or
+    None if that is not recorded"""
+
+    if not os.path.exists(self.filename): return None
+
+    line = open(self.filename, 'rt').readline()
+    if line.startswith('B ') and line.endswith('\n'): return line[2:-1]
+    return None
+
+  def replay(self, data):
+    """Applies all changes recorded in the journal to the data, in order.
+    Returns the number of changes applied. An incomplete last line, that may
+    have been left by a crash, is ignored."""
+
+    if not os.path.exists(self.filename): return 0
+
+    count = 0
+    for line in open(self.filename, 'rt'):
+      if not line.endswith('\n'): break #interrupted while writing
+      entry = line.split()
+      if entry[0] == 'B': continue #recorded base, see recorded_base()
+      if entry[0] == 'S':
+        data[int(entry[1])] = zip([int(k) for k in entry[2::2]],
+            [int(k) for k in entry[3::2]])
+      elif entry[0] == 'D':
+        if int(entry[1]) in data: del data[int(entry[1])]
+      else:
+        raise RuntimeError, "journal '%s' has an invalid entry: %s" % \
+            (self.filename, line.strip())
+      count += 1
+
+    return count
+
+  def clear(self):
+    """Removes all changes from the journal"""
+
+    self.close()
+    if os.path.exists(self.filename): os.unlink(self.filename)
+
+  def close(self):
+    """Closes the journal file, if it is opened"""
+
+    if self.fp is not None:
+      self.fp.close()
+      self.fp = None
+
 def check_input(data, header, shape):
   """Checks the input data for inconsistencies w.r.t. the input video
   shape.
@@ -86,7 +323,7 @@ def check_input(data, header, shape):
       if y >= shape[1]:
         raise RuntimeError, 'Input data at frame %d for keypoint "%s" has an "y" value (%d) greater or equal the video height (%d)' % (frame, header[i], y, shape[1])
 
-def load(fp, fs=" "):
+def load(fp, fs=" ", array=False):
   """Loads a given data set from a file, returning a dictionary with annotations
 
   Parameters
@@ -97,45 +334,71 @@ def load(fp, fs=" "):
   fs
     The field separator to use. A single space by default.
 
+  array
+    If set, return the annotations in an AnnotationArray instead of a
+    dictionary.
+
+  Files in binary format (see save_binary()) are detected automatically and
+  memory-mapped when loaded as an AnnotationArray.
+
   Returns the loaded data as a tuple (data, header). If there is no header,
   then the entry in the output data is set a sequence of numbers (as strings),
   starting from '0' (e.g. ['0', '1', '2', '3'], for a 4-keypoint
   configuration).
   """
 
+  if is_binary(fp):
+    data, header = load_binary(fp)
+    if not array: data = data.to_dict()
+    return (data, header)
+
   if isinstance(fp, (str, unicode)): fp = open(fp, 'rt')
 
   import csv
+  import itertools
 
-  # load all file at once
-  r = list(csv.reader(fp, delimiter=fs))
+  # rows are parsed as they are read, only the first two are needed upfront
+  # to detect the header
+  r = csv.reader(fp, delimiter=fs)
+  first = list(itertools.islice(r, 2))
 
-  data = {}
   header = None
 
-  if len(r[0]) == ((len(r[1])-1)/2):
-    header = r[0]
-    del r[0]
-  elif len(r[0]) != len(r[1]):
-    print r[0]
-    raise RuntimeError, "row 0 has a different length (%d) from row 1 (%d), but not quite as to make it a header - please verify" % (len(r[0]), len(r[1]))
-
-  for i, entry in enumerate(r):
-    data[int(entry[0])] = zip([int(k) for k in entry[1::2]],
-        [int(k) for k in entry[2::2]])
-    skeys = sorted(data.iterkeys())
+  if len(first) == 2:
+    if len(first[0]) == ((len(first[1])-1)/2):
+      header = first[0]
+      del first[0]
+    elif len(first[0]) != len(first[1]):
+      print first[0]
+      raise RuntimeError, "row 0 has a different length (%d) from row 1 (%d), but not quite as to make it a header - please verify" % (len(first[0]), len(first[1]))
+
+  if array:
+    from .keypoints import AnnotationArray
+    data = AnnotationArray(header=header)
+  else:
+    data = {}
+
+  previous = None
+
+  for i, entry in enumerate(itertools.chain(first, r)):
+    points = zip([int(k) for k in entry[1::2]], [int(k) for k in entry[2::2]])
     if i == 0:
       if header is not None:
         # check data[0] against header
-        if len(data[skeys[i]]) != len(header):
-          raise RuntimeError, "row 0 has different length (%d) than header (%d)" % (len(data[skeys[i]]), len(header))
-      continue
+        if len(points) != len(header):
+          raise RuntimeError, "row 0 has different length (%d) than header (%d)" % (len(points), len(header))
     else:
       # checks data[i] against data[i-1]
-      if len(data[skeys[i]]) != len(data[skeys[i-1]]):
-        raise RuntimeError, "row %d has different length (%d) than its predecessor (%d)" % (i, len(data[skeys[i]]), len(data[skeys[i-1]]))
+      if len(points) != previous:
+        raise RuntimeError, "row %d has different length (%d) than its predecessor (%d)" % (i, len(points), previous)
+    data[int(entry[0])] = points
+    previous = len(points)
 
   if header is None: 
     header = [str(k) for k in range(len(data[min(data.keys())]))]
 
+  if array:
+    data.header = header
+    data.resize(max(data.keys()) + 1)
+
   return (data, header)
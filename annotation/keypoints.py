@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Andre Anjos <andre.anjos@idiap.ch>
+# Mon 30 Jul 2012 09:41:22 CEST 
+
+"""A compact container for keypoint annotations backed by numpy arrays.
+"""
+
+import numpy
+
+class AnnotationArray(object):
+  """Keypoint annotations for a video, stored as a (frames, keypoints, 2)
+  integer array of (x, y) coordinates and a boolean mask telling which frames
+  are annotated.
+
+  Objects of this class behave like the dictionaries used elsewhere in this
+  package, where keys are frame numbers and values are lists of (x, y) tuples
+  for each keypoint. Values returned are copies: to change the annotations of
+  a frame, assign a new list of points to it. Assigning to frames past the
+  end of the container makes it grow.
+  """
+
+  def __init__(self, length=0, keypoints=None, header=None, dtype='int32'):
+    """Creates a new container with no annotated frames.
+
+    Parameters
+
+    length
+      The number of frames to allocate space for
+
+    keypoints
+      The number of keypoints on each frame. If not set, use the length of
+      the header. If that is not set either, it is taken from the first
+      annotation assigned to the container.
+
+    header
+      The names of each keypoint. If not set, keypoints are named with their
+      indexes, starting from '0'.
+
+    dtype
+      The numpy data type of the coordinates
+    """
+
+    if keypoints is None:
+      keypoints = len(header) if header is not None else 0
+
+    self.points = numpy.zeros((length, keypoints, 2), dtype=dtype)
+    self.mask = numpy.zeros((length,), dtype=bool)
+    self.header = list(header) if header is not None else None
+
+  @classmethod
+  def from_dict(cls, data, header=None, length=None):
+    """Builds a container from a dictionary of annotations, using the same
+    parameters as the constructor."""
+
+    if length is None: length = (max(data.iterkeys()) + 1) if data else 0
+    retval = cls(length, header=header)
+    for key, value in data.iteritems(): retval[key] = value
+    return retval
+
+  def to_dict(self):
+    """Returns the annotations as a dictionary"""
+
+    return dict(self.iteritems())
+
+  def labels(self):
+    """Returns the keypoint names"""
+
+    if self.header is not None: return self.header
+    return [str(k) for k in range(self.points.shape[1])]
+
+  def frames(self):
+    """Returns the number of frames the container has space for"""
+
+    return len(self.mask)
+
+  def resize(self, length):
+    """Changes the number of frames the container has space for, discarding
+    annotations past the new length"""
+
+    points = numpy.zeros((length,) + self.points.shape[1:],
+        dtype=self.points.dtype)
+    mask = numpy.zeros((length,), dtype=bool)
+    keep = min(length, len(self.mask))
+    points[:keep] = self.points[:keep]
+    mask[:keep] = self.mask[:keep]
+    self.points = points
+    self.mask = mask
+
+  def annotated(self):
+    """Returns the annotated frame numbers as a sorted numpy array"""
+
+    return numpy.flatnonzero(self.mask)
+
+  def __getitem__(self, key):
+
+    if not (0 <= key < len(self.mask)) or not self.mask[key]: 
+      raise KeyError, key
+    return [tuple(k) for k in self.points[key].tolist()]
+
+  def __setitem__(self, key, value):
+
+    if key < 0: raise KeyError, key
+
+    if not self.points.shape[1]:
+      # first annotation ever - sets the number of keypoints
+      self.points = numpy.zeros((len(self.mask), len(value), 2),
+          dtype=self.points.dtype)
+
+    if key >= len(self.mask):
+      self.resize(max(key + 1, 2 * len(self.mask)))
+
+    self.points[key] = value
+    self.mask[key] = True
+
+  def __delitem__(self, key):
+
+    if not (0 <= key < len(self.mask)) or not self.mask[key]: 
+      raise KeyError, key
+    self.mask[key] = False
+
+  def __contains__(self, key):
+
+    return 0 <= key < len(self.mask) and bool(self.mask[key])
+
+  def has_key(self, key):
+    return key in self
+
+  def get(self, key, default=None):
+    return self[key] if key in self else default
+
+  def __len__(self):
+    return int(self.mask.sum())
+
+  def __iter__(self):
+    return self.iterkeys()
+
+  def iterkeys(self):
+    return (int(k) for k in self.annotated())
+
+  def itervalues(self):
+    return (self[k] for k in self.iterkeys())
+
+  def iteritems(self):
+    return ((k, self[k]) for k in self.iterkeys())
+
+  def keys(self):
+    return list(self.iterkeys())
+
+  def values(self):
+    return list(self.itervalues())
+
+  def items(self):
+    return list(self.iteritems())
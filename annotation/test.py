@@ -0,0 +1,405 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Andre Anjos <andre.anjos@idiap.ch>
+# Mon 30 Jul 2012 17:12:05 CEST
+
+"""Checks the vectorized post-processing algorithms against the original,
+frame-by-frame, implementations, and the input/output of annotations.
+"""
+
+import os
+import sys
+import types
+import random
+import shutil
+import tempfile
+import unittest
+import StringIO
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'example')
+
+def reference_interpolate(data, length):
+  """The original implementation of algorithm.interpolate()"""
+
+  skeys = sorted(data.iterkeys())
+
+  if skeys[0] != 0:
+    skeys.insert(0,0)
+    data[0] = data[skeys[1]]
+
+  if skeys[-1] != (length-1):
+    skeys.append(length-1)
+    data[length-1] = data[skeys[-2]]
+
+  intervals = [(skeys[i], skeys[i+1]) for i in range(len(skeys)-1)]
+
+  for low, high in intervals:
+    diff = high - low # number of points to interpolate
+    delta = [((kp_high[0] - kp_low[0]) / float(diff), (kp_high[1] - kp_low[1]) / float(diff)) for kp_low, kp_high in zip(data[low], data[high])]
+    for k in range(1, diff):
+      data[low+k] = [(int(round(low_x+(delta[index][0]*k))),int(round(low_y+delta[index][1]*k))) for index, (low_x, low_y) in enumerate(data[low])]
+
+  return data
+
+def random_annotations(length, keypoints):
+  """Returns random sparse annotations for a video of the given length"""
+
+  frames = random.sample(range(length), random.randint(1, min(length, 12)))
+  return dict((k, [(random.randint(-50, 700), random.randint(-50, 500))
+    for i in range(keypoints)]) for k in frames)
+
+class InterpolateTest(unittest.TestCase):
+
+  def test01_example(self):
+
+    from .io import load
+    from .algorithm import interpolate
+
+    data, header = load(os.path.join(EXAMPLE, 'annotations.txt'))
+    expected, expected_header = load(os.path.join(EXAMPLE, 'interpolated.txt'))
+    self.assertEqual(header, expected_header)
+    self.assertEqual(interpolate(data, len(expected)), expected)
+
+  def test02_random(self):
+
+    from .algorithm import interpolate, InterpolatedView
+    from .keypoints import AnnotationArray
+
+    random.seed(0)
+    for i in range(400):
+      length = random.randint(1, 300)
+      data = random_annotations(length, random.randint(1, 17))
+      expected = reference_interpolate(dict(data), length)
+
+      self.assertEqual(interpolate(dict(data), length), expected)
+      self.assertEqual(interpolate(AnnotationArray.from_dict(data),
+        length).to_dict(), expected)
+      self.assertEqual(dict(enumerate(InterpolatedView(data, length))),
+          expected)
+
+class JournalTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.tmpdir, 'annotations.txt.journal')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test01_replay(self):
+
+    from .io import Journal
+
+    journal = Journal(self.filename, base='config.txt')
+    self.assertFalse(journal.exists())
+    journal.set(3, [(1, 2), (3, 4)])
+    journal.set(5, [(5, 6), (7, 8)])
+    journal.delete(3)
+    journal.close()
+
+    # an incomplete line, as left by a crash, is ignored
+    with open(self.filename, 'at') as fp: fp.write('S 9 1')
+
+    journal = Journal(self.filename)
+    self.assertTrue(journal.exists())
+    self.assertEqual(journal.recorded_base(), os.path.abspath('config.txt'))
+    data = {3: [(0, 0), (0, 0)], 4: [(1, 1), (1, 1)]}
+    self.assertEqual(journal.replay(data), 3)
+    self.assertEqual(data, {4: [(1, 1), (1, 1)], 5: [(5, 6), (7, 8)]})
+
+    journal.clear()
+    self.assertFalse(journal.exists())
+
+class SaveTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.tmpdir, 'annotations.txt')
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test01_backup(self):
+
+    from .io import save, load
+
+    save({0: [(1, 2)]}, self.filename, header=['a'], backup=True)
+    save({0: [(3, 4)]}, self.filename, header=['a'], backup=True)
+    self.assertEqual(load(self.filename)[0], {0: [(3, 4)]})
+    self.assertEqual(load(self.filename + '~')[0], {0: [(1, 2)]})
+    self.assertEqual(sorted(os.listdir(self.tmpdir)),
+        ['annotations.txt', 'annotations.txt~'])
+
+  def test02_failure(self):
+
+    from .io import save, load
+
+    save({0: [(1, 2)]}, self.filename, header=['a'])
+    # a failure while writing leaves the existing file untouched
+    self.assertRaises(TypeError, save, {0: [(1, 2)], 1: None},
+        self.filename, header=['a'])
+    self.assertEqual(load(self.filename)[0], {0: [(1, 2)]})
+    self.assertEqual(os.listdir(self.tmpdir), ['annotations.txt'])
+
+  def test03_empty_array(self):
+
+    from .io import save
+    from .keypoints import AnnotationArray
+
+    save(AnnotationArray(5, 2), self.filename, header=['a', 'b'])
+    self.assertEqual(open(self.filename).read(), 'a b\n')
+
+  def test04_row_length(self):
+
+    from .io import load
+
+    with open(self.filename, 'wt') as fp: fp.write('0 1 2 3 4\n1 1 2 3 4\n2 1 2\n')
+    for array in (False, True):
+      self.assertRaises(RuntimeError, load, self.filename, array=array)
+
+def bare_app(**attributes):
+  """Returns an AnnotatorApp that has no window, with the given attributes
+  set, for testing the parts of it that do not use Tk"""
+
+  import new
+  from collections import OrderedDict
+  from .video.script.annotate import AnnotatorApp
+
+  defaults = {
+      'zoom': 1,
+      'annotations': {},
+      'annotated': [],
+      'dirty': set(),
+      'intervals': OrderedDict(),
+      'journal': None,
+      'output': None,
+      'keypoint_config': [],
+      'unsaved': False,
+      'snapshot': None,
+      'saver': None,
+      'save_error': None,
+      'backed_up': False,
+      'after': lambda *args: None,
+      'update_status_bar': lambda: None,
+      }
+  defaults.update(attributes)
+  return new.instance(AnnotatorApp, defaults)
+
+class BinaryTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test01_round_trip(self):
+
+    import numpy
+    from .io import load, save, is_binary
+
+    original = os.path.join(EXAMPLE, 'annotations.txt')
+    binary = os.path.join(self.tmpdir, 'annotations.bin')
+    text = os.path.join(self.tmpdir, 'annotations.txt')
+
+    data, header = load(original)
+    save(data, binary, header=header, binary=True)
+    self.assertTrue(is_binary(binary))
+
+    # text -> binary -> text is lossless
+    converted, converted_header = load(binary)
+    self.assertEqual(converted_header, header)
+    save(converted, text, header=converted_header)
+    self.assertEqual(open(text, 'rb').read(), open(original, 'rb').read())
+
+    # binary files are memory-mapped when loaded as arrays
+    array, array_header = load(binary, array=True)
+    self.assertTrue(isinstance(array.points, numpy.memmap))
+    self.assertTrue(isinstance(array.mask, numpy.memmap))
+    self.assertEqual(array_header, header)
+    self.assertEqual(array.to_dict(), data)
+
+class AutosaveTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.tmpdir, 'annotations.txt')
+    self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+
+  def tearDown(self):
+    sys.stdout = self.stdout
+    shutil.rmtree(self.tmpdir)
+
+  def test01_backup_once(self):
+
+    from .io import save, load
+
+    save({0: [(1, 2)]}, self.filename, header=['a'])
+    app = bare_app(output=self.filename, keypoint_config=[(0, 0, 'a')],
+        annotations={0: [(1, 2)]}, annotated=[0])
+
+    for value in ((3, 4), (5, 6)):
+      app.annotations[0] = [value]
+      app.record(0)
+      app.unsaved = True
+      app.start_save()
+      app.finish_save()
+      self.assertFalse(app.unsaved)
+      self.assertEqual(load(self.filename)[0], {0: [value]})
+
+    # the backup holds the file from before the session, not the last save
+    self.assertEqual(load(self.filename + '~')[0], {0: [(1, 2)]})
+
+class OverlayTest(unittest.TestCase):
+
+  def test01_like_pil(self):
+
+    import numpy
+    from PIL import Image, ImageDraw
+    from .video.script.replay import Overlay
+
+    size = 41
+    c = size // 2
+    for R in range(1, 13):
+      image = Image.new('RGB', (size, size), (128, 128, 128))
+      ImageDraw.ImageDraw(image).ellipse((c-R, c-R, c+R, c+R),
+          fill='yellow', outline='black')
+      expected = numpy.transpose(numpy.dstack(image.split()), axes=(2,0,1))
+
+      frame = numpy.zeros((3, size, size), dtype='uint8') + 128
+      Overlay(R)(frame, [(c, c)])
+
+      # markings may only differ on a few pixels along the border
+      differ = (frame != expected).any(axis=0).sum()
+      self.assertTrue(differ <= 4*R, "%d pixels differ with R=%d" % (differ, R))
+
+  def test02_clipped(self):
+
+    import numpy
+    from .video.script.replay import Overlay
+
+    frame = numpy.zeros((3, 10, 12), dtype='uint8')
+    Overlay(4)(frame, [(0, 0), (11, 9), (-20, 5)])
+    self.assertEqual(tuple(frame[:,0,0]), (255, 255, 0))
+    self.assertEqual(tuple(frame[:,9,11]), (255, 255, 0))
+
+class AnnotatedIndexTest(unittest.TestCase):
+
+  def test01_random_edits(self):
+
+    random.seed(1)
+    app = bare_app()
+
+    for i in range(500):
+      frame = random.randint(0, 99)
+      if frame in app.annotations and random.random() < 0.5:
+        del app.annotations[frame]
+      else:
+        app.annotations[frame] = [(i, i)]
+      app.record(frame)
+
+      keys = sorted(app.annotations)
+      self.assertEqual(app.annotated, keys)
+      for k in (-1, 0, frame, 50, 99, 100):
+        before = [j for j in keys if j < k]
+        after = [j for j in keys if j > k]
+        self.assertEqual(app.previous_annotated(k),
+            before[-1] if before else None)
+        self.assertEqual(app.next_annotated(k), after[0] if after else None)
+
+class PreviewTest(unittest.TestCase):
+
+  def check(self, app, length):
+    """Checks the preview of all frames against interpolate()"""
+
+    from .algorithm import interpolate
+
+    original = app.zoom_compensated()
+    expected = interpolate(dict(original), length)
+    z = app.zoom
+    for k in range(length):
+      if k in app.annotations: continue
+      self.assertEqual(app.interpolated(k), [(int(round(x*z)),
+        int(round(y*z))) for (x, y) in expected[k]])
+
+  def test01_edits(self):
+
+    random.seed(2)
+    length = 120
+
+    for zoom in (1, 1.5):
+      app = bare_app(zoom=zoom)
+      for frame in random.sample(range(length), 8):
+        app.annotations[frame] = [(int(round(random.randint(0, 400)*zoom)),
+          int(round(random.randint(0, 300)*zoom))) for i in range(3)]
+        app.record(frame)
+      self.check(app, length)
+
+      for i in range(30):
+        frame = random.randint(0, length-1)
+        if frame in app.annotations and len(app.annotations) > 1 and \
+            random.random() < 0.5:
+          del app.annotations[frame]
+        else:
+          app.annotations[frame] = [(random.randint(0, 600),
+            random.randint(0, 450)) for i in range(3)]
+
+        # only the intervals on both sides of the edited frame are dropped
+        kept = dict((low, interval) for low, interval in
+            app.intervals.items() if low not in (frame,
+              app.previous_annotated(frame)))
+        app.record(frame)
+        self.assertEqual(sorted(app.intervals), sorted(kept))
+        for low, interval in kept.items():
+          self.assertTrue(app.intervals[low] is interval)
+
+        self.check(app, length)
+
+class VideoWriter(object):
+  """A stand-in for bob.io.VideoWriter that keeps frames in memory"""
+
+  written = []
+
+  def __init__(self, filename, height, width, framerate=None):
+    self.shape = (3, height, width)
+    VideoWriter.written = []
+
+  def append(self, frame):
+    assert frame.shape == self.shape, frame.shape
+    VideoWriter.written.append(frame.copy())
+
+class ScriptTest(unittest.TestCase):
+  """Runs the programs that write videos with a stand-in for bob"""
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.modules = dict((k, sys.modules.get(k)) for k in ('bob', 'bob.io'))
+    bob = types.ModuleType('bob')
+    bob.io = types.ModuleType('bob.io')
+    bob.io.VideoWriter = VideoWriter
+    sys.modules['bob'] = bob
+    sys.modules['bob.io'] = bob.io
+    self.stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+
+  def tearDown(self):
+    sys.stdout = self.stdout
+    for k, v in self.modules.items():
+      if v is None: del sys.modules[k]
+      else: sys.modules[k] = v
+    shutil.rmtree(self.tmpdir)
+
+  def test01_mktest(self):
+
+    import json
+    from .video.script.mktest import dump
+
+    metrics = os.path.join(self.tmpdir, 'metrics.json')
+    dump(os.path.join(self.tmpdir, 'test.avi'), 3, metrics)
+    self.assertEqual(len(VideoWriter.written), 3)
+    self.assertTrue(all(k.any() for k in VideoWriter.written)) #has numbers
+    summary = json.load(open(metrics))
+    self.assertEqual(summary['count'], 3)
+    self.assertEqual(sorted(summary['stages']), ['draw', 'encode'])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -7,20 +7,38 @@
 stream on the fly.
 """
 
-from PIL import Image
-import bob
+import threading
+import Queue
+from collections import OrderedDict
+from operator import itemgetter
+
+# how many open decoders to keep around as entry points into the stream
+CURSORS = 4
+
+# how many frames the background loader decodes at once, before letting
+# other requests use the decoders
+CHUNK = 16
 
 def frame_to_pil_image(frame):
   """Transforms a Bob video frame into a PIL image"""
 
-  return Image.merge('RGB', [Image.fromarray(frame[k]) for k in range(3)])
+  import numpy
+  from PIL import Image
+
+  # planar (3, height, width) to interleaved (height, width, 3) in one copy
+  return Image.fromarray(numpy.ascontiguousarray(frame.transpose(1, 2, 0)),
+      'RGB')
 
 class Video(object):
   """Video cache object compatible with bob.io.VideoReader"""
 
-  def __init__(self, filename, N=0, mid=0):
+  def __init__(self, filename, N=0, mid=0, prefetch=False, budget=None,
+      store=None, background=False):
     """Opens and preload N frames into memory. As soon as a non-loaded frame is
-    required, load it and load the next N frames as well.
+    required, load it and the frames around it that are not loaded yet. Frames
+    are evicted one by one, least-recently-used first, once the cache is full.
+    Frames are kept as decoded by Bob and only transformed into PIL images
+    when they are requested.
 
     Parameters
 
@@ -28,7 +46,9 @@ class Video(object):
       The name of the file to read containing the video
 
     N
-      The number of frames to cache. In reality (see below), we cache 2N.
+      The number of frames to load around a requested frame that is not in
+      the cache. In reality (see below), we load up to 2N. If 'budget' is not
+      set, the cache holds 2N frames.
 
     mid
       If you wouldn't like to start from 0, you can specify an arbitrary number
@@ -36,27 +56,159 @@ class Video(object):
       loaded. The cache will operate from this point minus N to this point plus
       N, loading a total of 2N frames each time a non-cached frame is
       requested.
+
+    prefetch
+      If set, starts a background thread that follows the direction in which
+      frames are being requested and decodes the next frames before they are
+      needed. Only useful if the video does not fit in the cache. Call close()
+      to stop it.
+
+    budget
+      If set, the maximum amount of memory, in bytes, to be used by cached
+      frames. The number of frames kept is calculated from the video size.
+      If neither this nor N are set, the whole video is loaded.
+
+    store
+      If set, the name of a frame store built for this video (see the
+      "store" module). Frames are then memory-mapped from that file instead
+      of decoded. Raises a RuntimeError if the store is not valid.
+
+    background
+      If set, only the frame at 'mid' is loaded before returning. The other
+      frames (the whole video, if neither N nor 'budget' are set) are loaded
+      by a background thread, while the 'loading' attribute holds the
+      [loaded, total] number of frames. It is set to None once all frames are
+      loaded. Frames that are requested before that are loaded immediately.
+      Call close() to stop loading.
     """
 
+    import bob
     self.video = bob.io.VideoReader(filename)
-    self.N = N
+    self.shape = (len(self.video), self.video.height, self.video.width)
     self.prefix = None
     self.suffix = None
-    
-    if N > 0 and N < len(self.video) and mid >=0:
-      self.start = mid-N if (mid-N) >= 0 else 0
-      self.end = mid+N if (mid+N) <= len(self.video) else len(self.video)
+
+    # decoded frames take 3 bytes per pixel, but once requested they become
+    # PIL RGB images, which use 4
+    frame_size = 4 * self.video.height * self.video.width
+
+    if budget:
+      self.capacity = min(len(self.video), max(2, budget // frame_size))
+      if N <= 0: N = max(1, self.capacity // 2)
+    elif N > 0:
+      self.capacity = min(len(self.video), 2*N)
     else:
-      self.start = 0
-      self.end = len(self.video)
+      self.capacity = len(self.video)
+    self.N = max(1, min(N, self.capacity // 2)) if N > 0 else len(self.video)
 
-    self.loaded = [frame_to_pil_image(frame) for frame in self.video[self.start:self.end]]
+    # decoders are kept open between loads as [position, iterator] pairs,
+    # where position is the index of the next frame the iterator produces,
+    # so loads after any of those positions only decode new frames.
+    # "decoding" guards the decoders, "lock" guards the cached frames.
+    self.cursors = []
+    self.mapped = None
+    if store is not None:
+      from .store import load
+      self.mapped = load(filename, store)
+    self.decoding = threading.Lock()
+    self.lock = threading.Lock()
+    self.frames = OrderedDict()
 
-    self.shape = (len(self.video), self.video.height, self.video.width)
+    mid = min(max(mid, 0), len(self.video)-1)
+    self.last = mid
+    self.worker = None
+    self.loader = None
+    self.loading = None
+    self.stopped = False
+
+    if background:
+      start, end = self.window(mid)
+      self.load(mid, mid+1)
+      self.loading = [1, end - start]
+      self.loader = threading.Thread(target=self.background_loop,
+          args=(start, end, mid), name='loader')
+      self.loader.daemon = True
+      self.loader.start()
+    else:
+      self.load(*self.window(mid))
+
+    if prefetch and self.capacity < len(self.video):
+      self.requests = Queue.Queue(maxsize=1)
+      self.worker = threading.Thread(target=self.prefetch_loop,
+          name='prefetch')
+      self.worker.daemon = True
+      self.worker.start()
 
   def framerate(self):
     return self.video.frame_rate
 
+  def window(self, mid):
+    """Returns the (start, end) range of frames to load around 'mid'"""
+
+    start = (mid-self.N) if (mid-self.N) > 0 else 0
+    end = (mid+self.N) if (mid+self.N) < len(self.video) else len(self.video)
+    return start, end
+
+  def decode(self, start, end):
+    """Decodes frames in the range [start, end) as arrays, starting from the
+    open decoder closest to 'start' and only opening a new one (from the
+    beginning of the stream) if all of them are past that point."""
+
+    if self.mapped is not None: return list(self.mapped[start:end])
+
+    usable = [c for c in self.cursors if c[0] <= start]
+    if usable:
+      cursor = max(usable, key=itemgetter(0))
+      self.cursors.remove(cursor)
+    else:
+      cursor = [0, iter(self.video)]
+
+    # most recently used last, the oldest decoder is closed if needed
+    self.cursors.append(cursor)
+    del self.cursors[:-CURSORS]
+
+    while cursor[0] < start:
+      next(cursor[1])
+      cursor[0] += 1
+
+    retval = []
+    while cursor[0] < end:
+      retval.append(next(cursor[1]))
+      cursor[0] += 1
+
+    return retval
+
+  def positioned(self, key):
+    """Tells if one of the open decoders will produce 'key' next"""
+
+    if self.mapped is not None: return True
+    return any(c[0] == key for c in self.cursors)
+
+  def store(self, start, frames):
+    """Inserts decoded frames starting at 'start', evicting the least recently
+    used ones if the cache is full."""
+
+    with self.lock:
+      for k, frame in enumerate(frames):
+        self.frames.pop(start+k, None)
+        self.frames[start+k] = frame
+      while len(self.frames) > self.capacity:
+        self.frames.popitem(last=False)
+
+  def load(self, start, end):
+    """Loads all frames in the range [start, end) that are not cached yet.
+    Must be called with "decoding" held or before the worker is started."""
+
+    missing = [k for k in range(start, end) if k not in self.frames]
+
+    # decodes contiguous runs in order, so the decoder only moves forward
+    i = 0
+    while i < len(missing):
+      j = i
+      while j+1 < len(missing) and missing[j+1] == missing[j] + 1: j += 1
+      self.store(missing[i], self.decode(missing[i], missing[j]+1))
+      i = j + 1
+
   def __getitem__(self, key):
     
     # sanity checks and range inversion
@@ -64,16 +216,42 @@ class Video(object):
     if key >= len(self.video):
       raise IndexError, "input video only has %d frames" % len(self.video)
 
+    with self.lock:
+      frame = self.frames.pop(key, None)
+      if frame is not None: self.frames[key] = frame #most recently used
+
     # load if required
-    if key >= self.end or key < self.start:
-      if self.prefix is not None: self.prefix()
-      self.start = (key-self.N) if (key-self.N) > 0 else 0
-      self.end = (key+self.N) if (key+self.N) < len(self.video) else len(self.video)
-      self.loaded = [frame_to_pil_image(frame) for frame in self.video[self.start:self.end]]
-      if self.suffix is not None: self.suffix()
+    if frame is None:
+
+      with self.decoding:
+
+        expensive = not self.positioned(key)
+        if expensive and self.prefix is not None: self.prefix()
+
+        if not expensive or self.loading is not None:
+          # either the decoder is right there, this is only a single decode,
+          # or the background loader will take care of the other frames
+          self.load(key, key+1)
+        else:
+          self.load(*self.window(key))
+
+        if expensive and self.suffix is not None: self.suffix()
+
+        # the requested frame goes last so it is not the first to go
+        self.store(key, [self.frames[key]])
+        frame = self.frames[key]
+
+    # converts on first use only, then keeps the image instead of the array
+    from PIL import Image
+    if not isinstance(frame, Image.Image):
+      frame = frame_to_pil_image(frame)
+      with self.lock:
+        if key in self.frames: self.frames[key] = frame
+
+    if self.worker is not None: self.schedule(key)
 
     # return
-    return self.loaded[key-self.start]
+    return frame
 
   def __len__(self):
 
@@ -82,3 +260,68 @@ class Video(object):
   def on_cache_load(self, prefix=None, suffix=None):
     self.prefix = prefix
     self.suffix = suffix
+
+  def schedule(self, key):
+    """Asks the read-ahead worker to decode the frames following 'key', in the
+    direction the user is moving."""
+
+    direction = key - self.last
+    self.last = key
+
+    if direction > 0:
+      run = (key+1, min(len(self.video), key+1+self.N))
+      check = range(run[0], min(run[1], key+1+self.N/2))
+    elif direction < 0:
+      run = (max(0, key-self.N), key)
+      check = range(max(0, key-self.N/2), key)
+    else:
+      return
+
+    # top-up once less than N/2 frames are available in that direction
+    if all(k in self.frames for k in check): return
+
+    # only the most recent request is relevant - drop stale ones
+    try:
+      self.requests.get_nowait()
+    except Queue.Empty:
+      pass
+    self.requests.put(run)
+
+  def prefetch_loop(self):
+    """Decodes runs requested through schedule() until close() is called"""
+
+    while True:
+
+      run = self.requests.get()
+      if run is None: break
+
+      with self.decoding: self.load(*run)
+
+  def background_loop(self, start, end, mid):
+    """Loads frames in [start, end), starting from 'mid', a few at a time"""
+
+    for first, last in ((mid+1, end), (start, mid)):
+      for k in range(first, last, CHUNK):
+        if self.stopped: return
+        with self.decoding: self.load(k, min(k+CHUNK, last))
+        self.loading[0] += min(k+CHUNK, last) - k
+
+    self.loading = None
+
+  def close(self):
+    """Stops the background loader and read-ahead worker, if running"""
+
+    self.stopped = True
+    if self.loader is not None:
+      self.loader.join()
+      self.loader = None
+
+    if self.worker is None: return
+
+    try:
+      self.requests.get_nowait()
+    except Queue.Empty:
+      pass
+    self.requests.put(None)
+    self.worker.join()
+    self.worker = None
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Andre Anjos <andre.anjos@idiap.ch>
+# Thu 02 Aug 2012 16:20:48 CEST 
+
+"""Progress and throughput reporting for the batch scripts.
+"""
+
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+def hms(seconds):
+  """Formats a number of seconds as H:MM:SS"""
+
+  seconds = int(round(seconds))
+  return '%d:%02d:%02d' % (seconds // 3600, (seconds // 60) % 60, seconds % 60)
+
+class Progress(object):
+  """Follows the processing of a number of frames, printing the frame rate
+  and the estimated time to completion at a fixed rate, instead of once per
+  frame. It also accounts for the time spent on each processing stage (e.g.
+  decoding, drawing or encoding) and can save a summary of all this at the
+  end.
+
+  All methods can be called from multiple threads at the same time.
+  """
+
+  def __init__(self, total, label='frames', stream=sys.stdout, interval=None):
+    """Starts following progress.
+
+    Parameters
+
+    total
+      The total number of frames to process
+
+    label
+      What is being processed, printed on each report
+
+    stream
+      Where reports are written to
+
+    interval
+      The minimum number of seconds between reports. If not set, use 0.5 if
+      the stream is a terminal, where reports overwrite each other, or 10
+      otherwise (e.g. for log files).
+    """
+
+    self.total = total
+    self.label = label
+    self.stream = stream
+    self.tty = hasattr(stream, 'isatty') and stream.isatty()
+    if interval is None: interval = 0.5 if self.tty else 10.
+    self.interval = interval
+    self.count = 0
+    self.stages = {}
+    self.lock = threading.Lock()
+    self.start = self.reported = time.time()
+    self.end = None
+
+  def add(self, stage, seconds):
+    """Accounts for time spent on a given processing stage"""
+
+    with self.lock:
+      self.stages[stage] = self.stages.get(stage, 0.) + seconds
+
+  @contextmanager
+  def timed(self, stage):
+    """A context manager that accounts for the time spent within it on the
+    given processing stage"""
+
+    start = time.time()
+    try:
+      yield
+    finally:
+      self.add(stage, time.time() - start)
+
+  def update(self, count=1):
+    """Tells that 'count' more frames were processed, reporting if it is
+    time to"""
+
+    with self.lock:
+      self.count += count
+      now = time.time()
+      if now - self.reported < self.interval: return
+      self.reported = now
+      self.report(now)
+
+  def report(self, now):
+    """Writes a single progress report"""
+
+    elapsed = now - self.start
+    rate = self.count / elapsed if elapsed > 0 else 0.
+    line = '%d/%d %s (%.1f%%), %.1f fps' % (self.count, self.total,
+        self.label, 100. * self.count / max(self.total, 1), rate)
+    if self.end is None and rate > 0:
+      line += ', ETA %s' % hms((self.total - self.count) / rate)
+    elif self.end is not None:
+      line += ', took %s' % hms(elapsed)
+    self.stream.write(('\r' + line) if self.tty else (line + '\n'))
+    self.stream.flush()
+
+  def finish(self):
+    """Stops following progress and writes the last report, including the time
+    spent on each stage"""
+
+    with self.lock:
+      self.end = time.time()
+      self.report(self.end)
+      if self.stages:
+        self.stream.write(('\n' if self.tty else '') + ', '.join(
+          ['%s: %.1fs' % (k, v) for k, v in sorted(self.stages.items())]))
+      self.stream.write('\n')
+      self.stream.flush()
+
+  def summary(self):
+    """Returns a dictionary with the totals"""
+
+    with self.lock:
+      elapsed = (self.end or time.time()) - self.start
+      return {
+          'label': self.label,
+          'total': self.total,
+          'count': self.count,
+          'seconds': elapsed,
+          'fps': self.count / elapsed if elapsed > 0 else 0.,
+          'stages': dict(self.stages),
+          }
+
+  def save(self, filename):
+    """Saves the summary() in JSON format"""
+
+    import json
+    with open(filename, 'wt') as f:
+      json.dump(self.summary(), f, indent=2, sort_keys=True)
+      f.write('\n')
@@ -44,6 +44,13 @@ Default mode
     rewind N frames
   l, <Right>
     forward N frames
+  p
+    go to the previous annotated frame
+  n
+    go to the next annotated frame
+  i
+    toggles the preview of interpolated keypoints on frames that are not
+    annotated (as postproc.py would do), instead of the previous state
   D
     Delete annotations for the current frame
   S
@@ -51,7 +58,15 @@ Default mode
   Q
     Quits the application, saving annotations if required
   <Escape>
-    Quits the application, does not save anything, even if required
+    Quits the application, does not save anything, even if required. Changes
+    are not recovered on the next session either.
+
+.. note::
+
+  Autosaving is off by default. If enabled with --autosave, changes are
+  saved periodically, and <Escape> only discards the ones made since the last
+  save. In any case, the output file as it was before the session is kept
+  with a "~" appended to its name.
 
 .. note::
 
@@ -97,14 +112,18 @@ You can use the mouse to either drag-and-drop keypoints or move the closest keyp
 
 import os
 import sys
+import bisect
 import Tkinter as tkinter
-from PIL import Image, ImageTk
-import numpy.linalg
 from operator import itemgetter
+from collections import OrderedDict
 
 COLOR_ACTIVE = "yellow"
 COLOR_INACTIVE = "white"
 SHIFT = 0x0001
+RESIZED_FRAMES = 32 #zoomed frames to keep around
+INTERVALS = 16 #interpolated intervals between annotated frames to keep around
+LOADING_POLL = 250 #milliseconds between checks on background video loading
+SAVING_POLL = 100 #milliseconds between checks on background saving
 
 class HelpDialog(tkinter.Toplevel):
 
@@ -204,7 +223,7 @@ class AnnotatorApp(tkinter.Tk):
   """A wrapper for the annotation application"""
   
   def __init__(self, video, zoom, radius, skip_factor, config, input, 
-      output, start, *args, **kwargs):
+      output, start, journal=None, autosave=0, *args, **kwargs):
 
     tkinter.Tk.__init__(self, *args, **kwargs)
     self.title("annotate")
@@ -223,6 +242,15 @@ class AnnotatorApp(tkinter.Tk):
     self.unsaved = False #if we have data that needs saving
     self.keypoint_config = config
     self.annotations = input
+    self.journal = journal #records each change, if set
+    if journal is not None and journal.exists():
+      self.unsaved = True #recovered changes are not in the output yet
+    self.annotated = sorted(self.annotations.iterkeys()) #annotated frames
+    self.dirty = set() #frames changed since the last snapshot was taken
+    self.snapshot = None #zoom-compensated annotations, as last saved
+    self.saver = None #thread writing the output file, if any
+    self.backed_up = False #if the output from before this session was kept
+    self.save_error = None
     self.busyman = BusyManager(self)
 
     if self.zoom != 1:
@@ -245,12 +273,26 @@ class AnnotatorApp(tkinter.Tk):
 
     # place frame 0 on the screen and start the app
     self.curr_image = None
+    self.curr_photo = None
+    self.resized = OrderedDict()
+    self.preview = False #if unannotated frames show interpolated keypoints
+    self.intervals = OrderedDict()
+    self.pending_update = None
     self.keypoints = None
     self.dragged = [0, 0, None]
     self.curr_focus = None
     self.update_image()
     self.text_status.set('[OK] you can interact with this window. Press ? for help')
 
+    # follow frames being loaded in the background, if any
+    if self.video.loading is not None:
+      self.after(LOADING_POLL, self.on_loading)
+
+    # saves changes periodically, if we have an output file
+    self.autosave = autosave
+    if self.autosave > 0 and isinstance(self.output, (str,unicode)):
+      self.after(self.autosave, self.on_autosave)
+
     # resize all dialog boxes by default to be 200px wide
     self.option_add("*Dialog.msg.wrapLength", "200p")
 
@@ -280,19 +322,146 @@ class AnnotatorApp(tkinter.Tk):
     self.label_status.update_idletasks()
     self.busyman.notbusy()
 
+  def on_loading(self):
+    """Periodically called while the video loads in the background"""
+
+    self.update_status_bar()
+    if self.video.loading is not None:
+      self.after(LOADING_POLL, self.on_loading)
+
+  def compensated(self, points):
+    """Returns zoom-compensated points"""
+
+    z = self.zoom
+    return [(int(round(float(x)/z)), int(round(float(y)/z))) for x,y in points]
+
   def zoom_compensated(self):
     """Returns zoom-compensated annotations"""
 
-    def rounded(x, y, z):
-      return (int(round(float(x)/z)), int(round(float(y)/z)))
+    return dict((key, self.compensated(values)) for key, values in \
+        self.annotations.iteritems())
+
+  def previous_annotated(self, frame):
+    """Returns the closest annotated frame before the given one, or None"""
+
+    i = bisect.bisect_left(self.annotated, frame)
+    return self.annotated[i-1] if i > 0 else None
+
+  def next_annotated(self, frame):
+    """Returns the closest annotated frame after the given one, or None"""
+
+    i = bisect.bisect_right(self.annotated, frame)
+    return self.annotated[i] if i < len(self.annotated) else None
+
+  def record(self, frame):
+    """Marks a frame as changed, keeping the index of annotated frames up to
+    date, and records its current annotations in the journal"""
+
+    # the interpolation of the intervals on both sides of the frame changes
+    self.intervals.pop(frame, None)
+    self.intervals.pop(self.previous_annotated(frame), None)
+
+    i = bisect.bisect_left(self.annotated, frame)
+    found = i < len(self.annotated) and self.annotated[i] == frame
+    if self.annotations.has_key(frame):
+      if not found: self.annotated.insert(i, frame)
+    elif found:
+      del self.annotated[i]
+
+    self.dirty.add(frame)
+
+    if self.journal is None: return
+
+    if self.annotations.has_key(frame):
+      self.journal.set(frame, self.compensated(self.annotations[frame]))
+    else:
+      self.journal.delete(frame)
+
+  def take_snapshot(self):
+    """Returns a copy of the zoom-compensated annotations, only converting
+    the frames that changed since the last snapshot was taken"""
+
+    if self.snapshot is None:
+      self.snapshot = self.zoom_compensated()
+    else:
+      for frame in self.dirty:
+        if self.annotations.has_key(frame):
+          self.snapshot[frame] = self.compensated(self.annotations[frame])
+        elif frame in self.snapshot:
+          del self.snapshot[frame]
+    self.dirty.clear()
+
+    return dict(self.snapshot)
+
+  def write(self, data, header, backup):
+    """Writes a snapshot to the output file, runs in a separate thread"""
 
-    import copy
+    from ...io import save as file_save
+
+    try:
+      file_save(data, self.output, header=header, backup=backup)
+      self.save_error = None
+    except Exception as e:
+      self.save_error = e
+
+  def start_save(self):
+    """Starts writing the current annotations to the output file in the
+    background"""
+
+    import threading
+
+    header = [l for (x,y,l) in self.keypoint_config]
+    # only the first save of the session backs up the existing output file,
+    # so the backup holds what was there before the session started
+    self.saver = threading.Thread(target=self.write,
+        args=(self.take_snapshot(), header, not self.backed_up))
+    self.saver.start()
+    self.update_status_bar()
+    self.after(SAVING_POLL, self.on_saved)
 
-    retval = copy.deepcopy(self.annotations)
-    for key, values in retval.iteritems():
-      retval[key] = [rounded(x,y,self.zoom) for x,y in values]
+  def on_saved(self):
+    """Periodically called while the output file is written"""
 
-    return retval
+    if self.saver is None: return
+    if self.saver.is_alive():
+      self.after(SAVING_POLL, self.on_saved)
+      return
+
+    self.saver = None
+
+    import time
+    curtime = time.strftime('%H:%M:%S')
+    if self.save_error is not None:
+      sys.stdout.write("Warning: could not write annotations to '%s' (%s): %s\n" % (self.output, curtime, self.save_error))
+      self.snapshot = None #retry from scratch
+    else:
+      sys.stdout.write("Wrote annotations to '%s' (%s)\n" % (self.output,
+        curtime))
+      self.backed_up = True
+      if not self.dirty:
+        # all changes are now in the output file, further changes apply to it
+        self.unsaved = False
+        if self.journal is not None:
+          self.journal.clear()
+          self.journal.base = self.output
+    sys.stdout.flush()
+
+    self.update_status_bar()
+
+  def finish_save(self):
+    """Waits until the output file is completely written, if that is
+    happening"""
+
+    if self.saver is None: return
+    self.saver.join()
+    self.on_saved()
+
+  def on_autosave(self):
+    """Periodically saves changes in the background"""
+
+    if self.unsaved and self.annotations and self.saver is None:
+      self.start_save()
+    self.after(self.autosave, self.on_autosave)
 
   def save(self, *args, **kwargs):
     """Action executed when the user explicitly asks us to save the file"""
@@ -305,22 +474,16 @@ class AnnotatorApp(tkinter.Tk):
       header = [l for (x,y,l) in self.keypoint_config]
 
       if self.output: 
-        import time
-        curtime = time.strftime('%H:%M:%S')
-        sys.stdout.write("Writing annotations to '%s' (%s)..." % (self.output,
-          curtime))
-        sys.stdout.flush()
-        file_save(self.zoom_compensated(), self.output, header=header,
-            backup=True)
-        sys.stdout.write(" OK\n")
-        sys.stdout.flush()
+        # the file is written in the background, once the one in progress
+        # is finished
+        self.finish_save()
+        if self.unsaved: self.start_save()
       else: 
         sys.stdout.write('\n')
         sys.stdout.flush()
         file_save(self.zoom_compensated(), sys.stdout, header=header)
         sys.stdout.flush()
-      
-      self.unsaved = False
+        self.unsaved = False
 
     else:
 
@@ -330,24 +493,45 @@ class AnnotatorApp(tkinter.Tk):
   def on_quit_no_saving(self, *args, **kwargs):
     """On quit we either dump the output to screen or to a file."""
 
+    self.finish_save()
+
     if self.unsaved and self.annotations and \
         isinstance(self.output, (str,unicode)):
       sys.stdout.write("Warning: lost annotations\n")
       sys.stdout.flush()
 
+    # changes were either saved or discarded, nothing to recover from
+    if self.journal is not None: self.journal.clear()
+
+    self.video.close()
     self.destroy()
 
   def on_quit(self, *args, **kwargs):
     """On quit we either dump the output to screen or to a file."""
 
     self.save(*args, **kwargs)
+    self.finish_save()
+
+    if self.unsaved and self.annotations and self.journal is not None:
+      # saving failed, the journal keeps changes for the next session
+      self.journal.close()
+      sys.stdout.write("Warning: unsaved annotations are kept at '%s' and will be recovered on the next session\n" % self.journal.filename)
+      sys.stdout.flush()
+      self.video.close()
+      self.destroy()
+      return
+
     self.on_quit_no_saving(*args, **kwargs)
 
   def on_delete_current_frame_annotations(self, event):
     """Delete current frame annotations and reset the view"""
 
+    self.flush_pending_update()
+
     if self.annotations.has_key(self.curr_frame):
       del self.annotations[self.curr_frame]
+      self.unsaved = True
+      self.record(self.curr_frame)
       self.update_image()
 
   def on_help(self, event):
@@ -375,11 +559,57 @@ class AnnotatorApp(tkinter.Tk):
       self.text_status.set('[warning] cannot go before start')
       self.curr_frame = 0
     
+    # only the latest frame gets drawn once pending key events are handled
+    self.update_status_bar()
+    if self.pending_update is None:
+      self.pending_update = self.after_idle(self.on_pending_update)
+
+  def on_jump_annotated(self, event):
+    """Goes to the next or the previous annotated frame"""
+
+    if event.keysym == 'n':
+      frame = self.next_annotated(self.curr_frame)
+      if frame is None:
+        self.text_status.set('[warning] no annotated frames after this one')
+        return
+    else:
+      frame = self.previous_annotated(self.curr_frame)
+      if frame is None:
+        self.text_status.set('[warning] no annotated frames before this one')
+        return
+
+    self.curr_frame = frame
+
+    self.update_status_bar()
+    if self.pending_update is None:
+      self.pending_update = self.after_idle(self.on_pending_update)
+
+  def on_toggle_preview(self, event):
+    """Switches between showing the previous state or the interpolated
+    keypoints on frames that are not annotated"""
+
+    self.preview = not self.preview
     self.update_image()
 
+  def on_pending_update(self):
+    """Draws the current frame, after a series of frame changes"""
+
+    self.pending_update = None
+    self.update_image()
+
+  def flush_pending_update(self):
+    """Draws the current frame now if that is still pending, so keypoints on
+    the screen match the current frame before they are edited"""
+
+    if self.pending_update is not None:
+      self.after_cancel(self.pending_update)
+      self.on_pending_update()
+
   def set_keypoint(self, event):
     """Sets the given keypoint position immediately"""
 
+    self.flush_pending_update()
+
     # move the object the appropriate amount
     kpindex = self.immediate_keys.index(event.char)
     kpx, kpy, kpitem = self.keypoints[kpindex]
@@ -399,11 +629,14 @@ class AnnotatorApp(tkinter.Tk):
       self.annotations[self.curr_frame][kpindex] = (event.x, event.y)
 
     self.unsaved = True
+    self.record(self.curr_frame)
     self.update_status_bar()
 
   def set_keypoint_focus(self, event):
     """Sets the focus on the first keypoint in the canvas"""
 
+    self.flush_pending_update()
+
     if self.curr_focus is None:
       self.curr_focus = 0
       for obj in (self.keypoints[self.curr_focus][2][0] + self.keypoints[self.curr_focus][2][2]):
@@ -430,8 +663,11 @@ class AnnotatorApp(tkinter.Tk):
     def find_closest(x, y):
       """My own implementation to find the closest keypoint to the location
       clicked by the user."""
+      import numpy.linalg
       dist = [numpy.linalg.norm((x-k[0],y-k[1])) for k in self.keypoints]
       return min(enumerate(dist), key=itemgetter(1))[0]
+
+    self.flush_pending_update()
    
     # move the object the appropriate amount
     kpindex = find_closest(event.x, event.y)
@@ -452,6 +688,7 @@ class AnnotatorApp(tkinter.Tk):
       self.annotations[self.curr_frame][kpindex] = (event.x, event.y)
 
     self.unsaved = True
+    self.record(self.curr_frame)
     self.update_status_bar()
 
   def on_highlight_all(self, event):
@@ -471,6 +708,8 @@ class AnnotatorApp(tkinter.Tk):
   def on_move_all(self, event):
     """Moves a focused keypoint"""
 
+    self.flush_pending_update()
+
     # calculates the total motion
     dx, dy = (0, 0)
     if event.keysym in ('Right', 'l', 'L'): dx = self.skip_factor 
@@ -499,11 +738,14 @@ class AnnotatorApp(tkinter.Tk):
         self.annotations[self.curr_frame][i] = (kpx + dx, kpy + dy)
 
     self.unsaved = True
+    self.record(self.curr_frame)
     self.update_status_bar()
     
   def move_focused_keypoint(self, event):
     """Moves a focused keypoint"""
 
+    self.flush_pending_update()
+
     # move the object the appropriate amount
     kpx, kpy, kpitem = self.keypoints[self.curr_focus]
     dx, dy = (0, 0)
@@ -531,6 +773,7 @@ class AnnotatorApp(tkinter.Tk):
       self.annotations[self.curr_frame][self.curr_focus] = (kpx + dx, kpy + dy)
 
     self.unsaved = True
+    self.record(self.curr_frame)
     self.update_status_bar()
 
   def on_move(self, event):
@@ -583,6 +826,13 @@ class AnnotatorApp(tkinter.Tk):
     self.bind("j", self.on_move)
     self.bind("J", self.on_move)
 
+    # jump between annotated frames
+    self.bind("n", self.on_jump_annotated)
+    self.bind("p", self.on_jump_annotated)
+
+    # preview interpolation
+    self.bind("i", self.on_toggle_preview)
+
     # with control down, highlight all points in orange, move all together
     self.bind("<KeyPress-Control_L>", self.on_highlight_all)
     self.bind("<KeyRelease-Control_L>", self.on_unhighlight_all)
@@ -612,36 +862,94 @@ class AnnotatorApp(tkinter.Tk):
   def update_image(self):
     """Updates the image displayed on the given widget"""
 
-    # set or replace the current frame image
-    self.curr_photo = ImageTk.PhotoImage(self.video[self.curr_frame].resize(self.shape, Image.ANTIALIAS))
-    if self.curr_image is None:
+    # set or replace the current frame image - the photo image is created
+    # once and then only gets new contents pasted in
+    if self.curr_photo is None:
+      from PIL import ImageTk
+      self.curr_photo = ImageTk.PhotoImage('RGB', self.shape)
       self.curr_image = self.canvas.create_image(self.shape[0], self.shape[1],
           anchor=tkinter.SE, image=self.curr_photo)
-    else:
-      self.canvas.itemconfig(self.curr_image, image=self.curr_photo)
+    self.curr_photo.paste(self.zoomed(self.curr_frame))
 
     # show keypoints
     use_annotation = self.annotations.get(self.curr_frame, None)
+    if use_annotation is None and self.preview:
+      use_annotation = self.interpolated(self.curr_frame)
     if use_annotation is None:
-      # try to get an annotation from any of the previous frames
-      use_frame = self.curr_frame - 1
-      while use_frame >= 0:
-        if self.annotations.has_key(use_frame):
-          use_annotation = self.annotations[use_frame]
-          break
-        use_frame -= 1
+      # try to get an annotation from the closest of the previous frames
+      use_frame = self.previous_annotated(self.curr_frame)
+      if use_frame is not None:
+        use_annotation = self.annotations[use_frame]
     self.show_keypoints(use_annotation)
 
     self.update_status_bar()
 
+  def interpolated(self, frame):
+    """Returns the keypoints of a frame that is not annotated, interpolated
+    from the closest annotated frames around it like postproc.py does, or
+    None if there are no annotations. The interval between two annotated
+    frames is computed at once, on the saved (zoom-compensated) coordinates,
+    and the last few intervals are kept around."""
+
+    low = self.previous_annotated(frame)
+    high = self.next_annotated(frame)
+    if low is None and high is None: return None
+    if low is None: return self.annotations[high] #borrowed at the start
+    if high is None: return self.annotations[low] #repeated at the end
+
+    interval = self.intervals.pop(low, None)
+
+    if interval is None or interval[0] != high:
+      import numpy
+      from ...algorithm import linear, round_half_away
+      keys = numpy.array([low, high])
+      values = numpy.array([self.compensated(self.annotations[low]),
+        self.compensated(self.annotations[high])])
+      points = linear(keys, values, numpy.arange(low+1, high))
+      interval = (high, round_half_away(points * self.zoom).astype(int))
+      if len(self.intervals) >= INTERVALS:
+        self.intervals.popitem(last=False)
+
+    self.intervals[low] = interval #most recently used
+    return [tuple(k) for k in interval[1][frame-low-1].tolist()]
+
+  def zoomed(self, frame):
+    """Returns the given frame resized to the current zoom factor, keeping
+    the last few resized frames around"""
+
+    image = self.resized.pop(frame, None)
+
+    if image is None:
+      image = self.video[frame]
+      if image.size != self.shape:
+        from PIL import Image
+        image = image.resize(self.shape, Image.ANTIALIAS)
+      if len(self.resized) >= RESIZED_FRAMES:
+        self.resized.popitem(last=False)
+
+    self.resized[frame] = image #most recently used
+    return image
+
   def update_status_bar(self):
 
     # updates the status bar
-    annotated = '(previous state)'
-    if not self.annotations: annotated = '(no annotations)'
+    annotated = '(no previous state)'
+    previous = self.previous_annotated(self.curr_frame)
+    if previous is not None:
+      annotated = '(previous state, frame %03d)' % (previous+1)
+    if self.preview and self.annotated:
+      annotated = '(interpolated)'
+    if not self.annotated: annotated = '(no annotations)'
     if self.annotations.has_key(self.curr_frame): annotated = ' (annotated)'
-    self.text_status.set('[status] frame %03d/%03d %s' % (self.curr_frame+1, 
-      len(self.video), annotated))
+    # read once, the loader thread resets it when done
+    loading = self.video.loading
+    if loading is not None:
+      loading = ' [loading %d%%]' % (100 * loading[0] / loading[1])
+    else:
+      loading = ''
+    saving = ' [saving]' if self.saver is not None else ''
+    self.text_status.set('[status] frame %03d/%03d %s%s%s' % \
+        (self.curr_frame+1, len(self.video), annotated, loading, saving))
 
   def on_keypoint_button_press(self, event):
     """What happens when the user clicks close to a key point
@@ -654,8 +962,11 @@ class AnnotatorApp(tkinter.Tk):
     def find_closest(x, y):
       """My own implementation to find the closest keypoint to the location
       clicked by the user."""
+      import numpy.linalg
       dist = [numpy.linalg.norm((x-k[0],y-k[1])) for k in self.keypoints]
       return min(enumerate(dist), key=itemgetter(1))[0]
+
+    self.flush_pending_update()
    
     index = find_closest(event.x, event.y)
 
@@ -703,6 +1014,7 @@ class AnnotatorApp(tkinter.Tk):
       self.annotations[self.curr_frame][kpindex] = (event.x, event.y)
 
     self.unsaved = True
+    self.record(self.curr_frame)
     self.update_status_bar()
 
   def add_drag_n_drop(self):
@@ -801,6 +1113,15 @@ def process_arguments():
   parser.add_argument('-c', '--cache', dest='cache', metavar='INT',
       type=int, default=0, help="Number of frames to cache in a video stream (defaults to %(default)s; a value smaller or equal to zero disables the cache)")
 
+  parser.add_argument('-M', '--cache-mb', dest='cache_mb', metavar='MB',
+      type=int, default=0, help="Maximum amount of memory, in megabytes, to use for cached frames. Least recently seen frames are evicted first. If set, the value of --cache only defines how many frames are loaded around a missing one (defaults to %(default)s; a value smaller or equal to zero disables this limit)")
+
+  parser.add_argument('-p', '--prefetch', dest='prefetch', default=False,
+      action='store_true', help="Decodes the next frames in the background, following the direction you are moving in the video (only useful if the cache is enabled)")
+
+  parser.add_argument('-F', '--frame-store', dest='store', metavar='FILE',
+      type=str, default=None, help="Memory-maps frames from a store built with framestore.py instead of decoding the video (defaults to the video file name with '.frames' appended, if that exists and is valid)")
+
   parser.add_argument('-z', '--zoom', dest='zoom', metavar='N',
       type=float, default=1,
       help="Zoom in/out by the given factor (defaults to %(default)s; values between 0 and 1 will zoom-out while values greater then 1 will zoom-in)")
@@ -819,7 +1140,11 @@ def process_arguments():
 
   parser.add_argument('-o', '--output', dest='output',
       metavar='FILE', type=str, default=None,
-      help="Output file that will contain the annotations recorded at this session (if not given, dump to stdout; if file exists, a backup is made)")
+      help="Output file that will contain the annotations recorded at this session (if not given, dump to stdout; if file exists, a backup is made the first time it is saved in the session)")
+
+  parser.add_argument('-a', '--autosave', dest='autosave', metavar='SECONDS',
+      type=float, default=0,
+      help="Saves changes to the output file in the background every given number of seconds. Note <Escape> can then only discard changes made since the last save (defaults to %(default)s; a value smaller or equal to zero disables autosaving)")
 
   from ..version import __version__
   name = os.path.basename(os.path.splitext(sys.argv[0])[0])
@@ -831,6 +1156,14 @@ def process_arguments():
   if not os.path.exists(args.video):
     parser.error("Input video file '%s' cannot be read" % args.video)
 
+  from ..store import filename, check
+  if args.store is None:
+    if check(args.video) is None: args.store = filename(args.video)
+  else:
+    problem = check(args.video, args.store)
+    if problem is not None:
+      parser.error("Cannot use frame store: %s" % problem)
+
   if args.zoom <= 0:
     parser.error("This app does not accept zooming out ! Choose a zoom factor that is >= 1.")
 
@@ -890,21 +1223,45 @@ def main():
 
   args = process_arguments()
  
-  sys.stdout.write("Loading input video from '%s' (cache=%d)..." % \
-      (args.video, args.cache))
+  sys.stdout.write("Loading input video from '%s' (cache=%d, %dMB)..." % \
+      (args.video, args.cache, args.cache_mb))
   sys.stdout.flush()
-  v = Video(args.video, N=args.cache, mid=args.start)
+  v = Video(args.video, N=args.cache, mid=args.start, prefetch=args.prefetch,
+      budget=args.cache_mb*1024*1024 if args.cache_mb > 0 else None,
+      store=args.store, background=True)
 
   sys.stdout.write("OK!\nLoading keypoint configuration at '%s'..." % \
       (args.config,))
   sys.stdout.flush()
   config, input = load_config(args.config, v.shape)
 
+  # changes are journaled next to the output file, so they can be recovered
+  # if this session crashes before they are saved
+  journal = None
+  if args.output:
+    from ...io import Journal, load, check_input
+    journal = Journal(args.output + '.journal', base=args.config)
+    if journal.exists():
+      # changes apply to the file the annotations were last loaded from or
+      # saved to, which may not be the configuration
+      base = journal.recorded_base()
+      if base is not None and \
+          os.path.abspath(base) != os.path.abspath(args.config):
+        if not os.path.exists(base):
+          raise RuntimeError, "Cannot recover unsaved changes from '%s': the annotations they apply to at '%s' are missing" % (journal.filename, base)
+        input, header = load(base)
+        journal.base = base
+      sys.stdout.write(" OK!\nRecovering unsaved changes from '%s' on top of '%s'..." % (journal.filename, journal.base))
+      sys.stdout.flush()
+      sys.stdout.write(" %d changes" % journal.replay(input))
+      if input: check_input(input, [l for (x,y,l) in config], v.shape)
+
   sys.stdout.write(" OK!\nLaunching annotation interface...\n")
   sys.stdout.flush()
 
   app = AnnotatorApp(v, args.zoom, args.radius, args.skip_factor, config,
-      input, args.output, args.start)
+      input, args.output, args.start, journal,
+      int(args.autosave * 1000) if args.autosave > 0 else 0)
   app.mainloop()
 
 if __name__ == '__main__':
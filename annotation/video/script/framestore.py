@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Andre Anjos <andre.anjos@idiap.ch>
+# Wed 25 Jul 2012 11:03:15 CEST 
+
+"""Builds or checks a store of decoded frames for a video file.
+
+Once built, the annotation tool memory-maps frames from the store instead of
+decoding the video, so sessions start instantly and concurrent annotators on
+the same machine share the same memory pages. A store is automatically
+invalidated if the size or modification time of the video changes.
+"""
+
+import os
+import sys
+
+def process_arguments():
+
+  import argparse
+
+  parser = argparse.ArgumentParser(description=__doc__,
+      formatter_class=argparse.RawDescriptionHelpFormatter)
+
+  parser.add_argument('video', metavar='VIDEO', type=str,
+      help="Video file to load")
+
+  parser.add_argument('-o', '--output', dest='output',
+      metavar='FILE', type=str, default=None,
+      help="Frame store file to build or check (defaults to the video file name with '.frames' appended)")
+
+  parser.add_argument('-c', '--check', dest='check', default=False,
+      action='store_true', help="Only checks if the frame store is valid for the video. The exit status is 1 if it is not.")
+
+  parser.add_argument('-f', '--force', dest='force', default=False,
+      action='store_true', help="Builds the frame store even if a valid one already exists")
+
+  from ..version import __version__
+  name = os.path.basename(os.path.splitext(sys.argv[0])[0])
+  parser.add_argument('-V', '--version', action='version',
+      version='Video Keypoint Annotation Tool v%s (%s)' % (__version__, name))
+  
+  args = parser.parse_args()
+
+  if not os.path.exists(args.video):
+    parser.error("Input video file '%s' cannot be read" % args.video)
+
+  if args.output is None:
+    from ..store import filename
+    args.output = filename(args.video)
+
+  return args
+
+def main():
+
+  from ..store import build, check
+
+  args = process_arguments()
+
+  problem = check(args.video, args.output)
+
+  if args.check:
+    if problem is None:
+      sys.stdout.write("Frame store at '%s' is valid\n" % args.output)
+      sys.exit(0)
+    sys.stdout.write("Frame store is not valid: %s\n" % problem)
+    sys.exit(1)
+
+  if problem is None and not args.force:
+    sys.stdout.write("Frame store at '%s' is valid, not rebuilding it\n" % \
+        args.output)
+    return
+
+  def progress(k, total):
+    if k % 100 == 0 or k == total-1:
+      sys.stdout.write('.')
+      sys.stdout.flush()
+
+  sys.stdout.write("Decoding '%s' into '%s'" % (args.video, args.output))
+  sys.stdout.flush()
+  build(args.video, args.output, progress)
+  sys.stdout.write(' OK!\n')
+  sys.stdout.flush()
+
+if __name__ == '__main__':
+  main()
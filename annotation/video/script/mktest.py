@@ -24,6 +24,10 @@ def process_arguments():
       metavar='N', type=int, default=100, 
       help="Number of frames to generate on the test video (defaults to %(default)s)")
 
+  parser.add_argument('-m', '--metrics', dest='metrics',
+      metavar='FILE', type=str, default=None,
+      help="If set, saves a summary of the throughput and the time spent on each step to this file, in JSON format")
+
   from ..version import __version__
   name = os.path.basename(os.path.splitext(sys.argv[0])[0])
   parser.add_argument('-V', '--version', action='version',
@@ -45,12 +49,13 @@ def process_arguments():
 
   return args
 
-def dump(output, N):
+def dump(output, N, metrics=None):
   """Dumps the annotated video"""
 
   import bob
   import numpy
   from PIL import Image, ImageDraw, ImageFont
+  from ..progress import Progress
 
   width = 640
   height = 480
@@ -61,27 +66,28 @@ def dump(output, N):
   else:
     font = None
 
-  sys.stdout.write('Saving %d frames at "%s"' % (N, output))
+  sys.stdout.write('Saving %d frames at "%s"\n' % (N, output))
   sys.stdout.flush()
   outv = bob.io.VideoWriter(output, height, width, framerate=10)
+  progress = Progress(N)
   for k in range(N):
-    frame = Image.new('RGB', (width, height)) #black background
-    draw = ImageDraw.ImageDraw(frame)
-    draw.text( (width/2-fontsize/2, height/2-fontsize/2), 
-        str(k), fill='white', font=font )
-    f = numpy.transpose(numpy.dstack(frame.split()), axes=(2,0,1))
-    outv.append(f)
-    sys.stdout.write('.')
-    sys.stdout.flush()
-
-  sys.stdout.write(' OK!\n')
-  sys.stdout.flush()
+    with progress.timed('draw'):
+      frame = Image.new('RGB', (width, height)) #black background
+      draw = ImageDraw.ImageDraw(frame)
+      draw.text( (width/2-fontsize/2, height/2-fontsize/2), 
+          str(k), fill='white', font=font )
+      f = numpy.transpose(numpy.dstack(frame.split()), axes=(2,0,1))
+    with progress.timed('encode'): outv.append(f)
+    progress.update()
+
+  progress.finish()
+  if metrics: progress.save(metrics)
 
 def main():
 
   args = process_arguments()
  
-  dump(args.output, args.N)
+  dump(args.output, args.N, args.metrics)
 
 if __name__ == '__main__':
   main()
@@ -8,14 +8,15 @@
 
 import os
 import sys
-from PIL import Image
 
 def load_input(filename, shape):
-  """Loads the keypoint input file, checks the input shape for problems."""
+  """Loads the keypoint input file, checks the input shape for problems.
+  Annotations are kept in a compact AnnotationArray, memory-mapped if the
+  file is in binary format."""
 
   from ...io import load, check_input
 
-  data, header = load(filename)
+  data, header = load(filename, array=True)
 
   if not data:
     raise RuntimeError, 'No keypoints found at %s' % filename
@@ -25,7 +26,14 @@ def load_input(filename, shape):
   return data, header
 
 def shape(filename):
-  """Returns the number of frames in the input video"""
+  """Returns the number of frames in the input video, its height and width.
+  These are read from the frame store of the video, if there is a valid one,
+  which avoids loading bob at all."""
+
+  from ..store import filename as store_filename, check, read_header
+  if check(filename) is None:
+    with open(store_filename(filename), 'rb') as fp: header = read_header(fp)
+    return header['frames'], header['height'], header['width']
 
   import bob
   reader = bob.io.VideoReader(filename)
@@ -47,11 +55,18 @@ def process_arguments():
   parser.add_argument('output', metavar='FILE', type=str,
       help="Output file that will contain the modified annotations")
 
-  algo_choices = ('interpolate', 'expand', 'none')
+  algo_choices = ('interpolate', 'expand', 'compress', 'none')
   parser.add_argument('-a', '--algorithm', dest='algo',
       type=str, choices=algo_choices, default=algo_choices[0],
       help="Post-processing algorithm for annotations (options are one of '%s'; defaults to '%s')" % ('|'.join(algo_choices), '%(default)s'))
 
+  parser.add_argument('-t', '--tolerance', dest='tolerance', metavar='PX',
+      type=float, default=1.0,
+      help="When compressing annotations, the maximum distance in pixels between any input keypoint and the same keypoint once the output is interpolated again (defaults to %(default)s)")
+
+  parser.add_argument('-b', '--binary', dest='binary', default=False,
+      action='store_true', help="Saves the output annotations in binary format, that can be memory-mapped. Input annotations in binary format are detected automatically. Use this with '--algorithm=none' to convert between formats.")
+
   from ..version import __version__
   name = os.path.basename(os.path.splitext(sys.argv[0])[0])
   parser.add_argument('-V', '--version', action='version',
@@ -64,6 +79,9 @@ def process_arguments():
   if not os.path.exists(args.video):
     parser.error("Input video file '%s' cannot be read" % args.video)
 
+  if args.tolerance < 0:
+    parser.error("Cannot compress annotations with a tolerance < 0")
+
   if not os.path.exists(args.keypoints):
     parser.error("Input keypoint file '%s' cannot be read" %
         args.config)
@@ -102,13 +120,18 @@ def main():
     elif args.algo == 'expand':
       from ...algorithm import past_expand
       data = past_expand(data, video_shape[0])
+    elif args.algo == 'compress':
+      from ...algorithm import compress
+      size = len(data)
+      data = compress(data, args.tolerance)
+      sys.stdout.write(" kept %d of %d frames" % (len(data), size))
     sys.stdout.write(" OK!\n")
     sys.stdout.flush()
 
   from ...io import save
   sys.stdout.write("Saving post-processed annotations at '%s'..." % args.output)
   sys.stdout.flush()
-  save(data, args.output, header=header, backup=True)
+  save(data, args.output, header=header, backup=True, binary=args.binary)
   sys.stdout.write(" OK!\n")
   sys.stdout.flush()
 
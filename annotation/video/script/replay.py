@@ -8,14 +8,15 @@
 
 import os
 import sys
-import bob
 
 def load_input(filename, shape):
-  """Loads the keypoint input file, checks the input shape for problems."""
+  """Loads the keypoint input file, checks the input shape for problems.
+  Annotations are kept in a compact AnnotationArray, memory-mapped if the
+  file is in binary format."""
 
   from ...io import load, check_input
 
-  data, header = load(filename)
+  data, header = load(filename, array=True)
 
   if not data:
     raise RuntimeError, 'No keypoints found at %s' % filename
@@ -44,6 +45,18 @@ def process_arguments():
       metavar='N', type=int, default=4, 
       help="Diameter of visual keypoints while annotating (defaults to %(default)s)")
 
+  parser.add_argument('-w', '--workers', dest='workers',
+      metavar='N', type=int, default=2, 
+      help="Number of threads drawing markings on frames, while one other thread decodes and another encodes them (defaults to %(default)s)")
+
+  parser.add_argument('-q', '--queue-depth', dest='depth',
+      metavar='N', type=int, default=16, 
+      help="Maximum number of frames waiting between each of the decoding, drawing and encoding steps (defaults to %(default)s)")
+
+  parser.add_argument('-m', '--metrics', dest='metrics',
+      metavar='FILE', type=str, default=None,
+      help="If set, saves a summary of the rendering throughput and the time spent on each step to this file, in JSON format")
+
   algo_choices = ('none', 'interpolate', 'expand')
   parser.add_argument('-a', '--algorithm', dest='algo',
       type=str, choices=algo_choices, default=algo_choices[0],
@@ -64,6 +77,12 @@ def process_arguments():
   if args.radius <= 0:
     parser.error("Cannot have annotations with a radius <= 0")
 
+  if args.workers <= 0:
+    parser.error("Cannot draw markings with a number of workers <= 0")
+
+  if args.depth <= 0:
+    parser.error("Cannot use a queue depth <= 0")
+
   if not os.path.exists(args.keypoints):
     parser.error("Input keypoint file '%s' cannot be read" %
         args.config)
@@ -79,41 +98,169 @@ def process_arguments():
 
   return args
 
+class Overlay(object):
+  """Stamps keypoint markings directly on planar (color, height, width) video
+  frames, without converting them to images. The discs used as markings are
+  computed once, so the cost of drawing depends only on the number of
+  keypoints."""
+
+  def __init__(self, R, fill=(255, 255, 0), outline=(0, 0, 0)):
+    """Prepares the markings.
+
+    Parameters
+
+    R
+      The radius of each marking, in pixels
+
+    fill
+      The (red, green, blue) color inside markings. Yellow by default.
+
+    outline
+      The (red, green, blue) color of the marking borders. Black by default.
+    """
+
+    import numpy
+
+    y, x = numpy.mgrid[-R:R+1, -R:R+1]
+    distance = x**2 + y**2
+    self.R = R
+    # half-pixel thresholds follow the circles PIL's ImageDraw.ellipse() draws
+    self.disc = distance <= (R+0.5)**2
+    self.inside = distance <= (R-0.5)**2
+    self.fill = fill
+    self.outline = outline
+
+  def __call__(self, frame, annotations):
+    """Draws markings for all (x, y) annotations on the frame, in place.
+    Markings can be partially out of the frame. Returns the frame."""
+
+    R = self.R
+    height, width = frame.shape[1:]
+
+    for (x, y) in annotations:
+
+      # clips the marking to the frame boundaries
+      top, left = max(y-R, 0), max(x-R, 0)
+      bottom, right = min(y+R+1, height), min(x+R+1, width)
+      if top >= bottom or left >= right: continue
+      rows = slice(top-(y-R), bottom-(y-R))
+      columns = slice(left-(x-R), right-(x-R))
+      disc = self.disc[rows, columns]
+      inside = self.inside[rows, columns]
+
+      for c in range(3):
+        region = frame[c, top:bottom, left:right]
+        region[disc] = self.outline[c]
+        region[inside] = self.fill[c]
+
+    return frame
+
 def annotate(frame, annotations, header, R):
   """Annotates the frame with nice markings"""
 
-  from PIL import Image, ImageDraw
-  import numpy
+  return Overlay(R)(frame, annotations)
 
-  img = Image.merge('RGB', [Image.fromarray(frame[i]) for i in range(3)])
-  draw = ImageDraw.ImageDraw(img)
-  for (x,y) in annotations:
-    draw.ellipse((x-R,y-R,x+R,y+R), fill='yellow', outline='black')
-  return numpy.transpose(numpy.dstack(img.split()), axes=(2,0,1))
+def dump(video, data, header, radius, output, workers=2, depth=16,
+    metrics=None):
+  """Dumps the annotated video
 
-def dump(video, data, header, radius, output):
-  """Dumps the annotated video"""
+  Decoding, drawing and encoding run in a pipeline: one thread decodes
+  frames, a pool of 'workers' threads draws the markings and the calling
+  thread encodes frames back in order. Queues between the stages hold at most
+  'depth' frames each. The decoder is also never more than 2*depth + workers
+  frames ahead of the encoder, so frames drawn out of order and waiting to be
+  encoded are bounded too, even if one of the workers stalls.
 
-  sys.stdout.write("Creating video file with annotations")
-  sys.stdout.flush()
-  outv = bob.io.VideoWriter(output, video.height, video.width, framerate=video.frame_rate)
+  If 'metrics' is set, a summary of the throughput and the time spent on
+  each stage is saved in that file, in JSON format.
+  """
 
-  for k, frame in enumerate(video):
-    if data.has_key(k):
-      outv.append(annotate(frame, data[k], header, radius))
-      sys.stdout.write('.')
-      sys.stdout.flush()
-    else:
-      outv.append(frame)
-      sys.stdout.write('x')
-      sys.stdout.flush()
+  import bob
+  import threading
+  import Queue
+  from ..progress import Progress
 
-  sys.stdout.write(' OK!\n')
+  sys.stdout.write("Creating video file with annotations\n")
   sys.stdout.flush()
+  outv = bob.io.VideoWriter(output, video.height, video.width, framerate=video.frame_rate)
+  overlay = Overlay(radius)
+  progress = Progress(len(video))
+
+  decoded = Queue.Queue(depth) #(k, frame) or None, once decoding is over
+  drawn = Queue.Queue(depth) #(k, frame) or None, once per worker
+  ahead = 2*depth + workers
+  slots = threading.Semaphore(ahead) #frames not encoded yet
+  errors = []
+
+  def decode():
+    try:
+      frames = iter(video)
+      k = 0
+      while not errors:
+        with progress.timed('decode'): frame = next(frames, None)
+        if frame is None: break
+        slots.acquire()
+        decoded.put((k, frame))
+        k += 1
+    except:
+      errors.append(sys.exc_info())
+    finally:
+      for i in range(workers): decoded.put(None)
+
+  def draw():
+    try:
+      while True:
+        item = decoded.get()
+        if item is None: break
+        k, frame = item
+        if data.has_key(k):
+          with progress.timed('overlay'): overlay(frame, data[k])
+        drawn.put((k, frame))
+    except:
+      errors.append(sys.exc_info())
+      # frames are no longer encoded, never blocks the decoder again
+      for i in range(ahead): slots.release()
+      while decoded.get() is not None: slots.release()
+    finally:
+      drawn.put(None)
+
+  threads = [threading.Thread(target=decode, name='decode')] + \
+      [threading.Thread(target=draw, name='draw-%d' % i) for i in range(workers)]
+  for t in threads:
+    t.daemon = True
+    t.start()
+
+  # encodes frames in order, holding the ones that arrive early
+  early = {}
+  current = 0
+  running = workers
+  while running:
+    item = drawn.get()
+    if item is None:
+      running -= 1
+      continue
+    early[item[0]] = item[1]
+    while current in early:
+      frame = early.pop(current)
+      if not errors:
+        with progress.timed('encode'): outv.append(frame)
+      slots.release()
+      progress.update()
+      current += 1
+
+  for t in threads: t.join()
+
+  if errors:
+    raise errors[0][0], errors[0][1], errors[0][2]
+
+  progress.finish()
+  if metrics: progress.save(metrics)
 
 def main():
 
   args = process_arguments()
+
+  import bob
  
   sys.stdout.write("Loading input at '%s'..." % (args.video,))
   sys.stdout.flush()
@@ -128,17 +275,15 @@ def main():
     sys.stdout.write("OK!\nPost-processing annotations with '%s'..." %
         args.algo.lower())
     sys.stdout.flush()
-    if args.algo == 'interpolate':
-      from ...algorithm import interpolate
-      data = interpolate(data, len(v))
-    elif args.algo == 'expand':
-      from ...algorithm import past_expand
-      data = past_expand(data, len(v))
+    # frames are only computed as they are dumped
+    from ...algorithm import InterpolatedView
+    data = InterpolatedView(data, len(v), args.algo)
 
   sys.stdout.write(" OK!\n")
   sys.stdout.flush()
 
-  dump(v, data, header, args.radius, args.output)
+  dump(v, data, header, args.radius, args.output, args.workers, args.depth,
+      args.metrics)
 
 if __name__ == '__main__':
   main()
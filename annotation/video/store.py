@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+# Andre Anjos <andre.anjos@idiap.ch>
+# Wed 25 Jul 2012 10:12:37 CEST 
+
+"""A persistent store of decoded video frames that can be memory-mapped.
+
+The store is a file with a fixed-size header followed by all frames of the
+video, in the same planar (color, height, width) uint8 layout produced by
+bob.io.VideoReader. The header records the size and modification time of the
+video it was built from, so a store becomes invalid as soon as the video
+changes.
+"""
+
+import os
+import struct
+
+MAGIC = 'AVFS'
+VERSION = 1
+EXTENSION = '.frames'
+
+# magic, version, frames, height, width, video size, video mtime, frame rate
+HEADER = '<4sIIIIQdd'
+HEADER_SIZE = 64 #struct.calcsize(HEADER) padded for aligned frames
+
+def filename(video):
+  """Returns the default store file name for a given video file"""
+
+  return video + EXTENSION
+
+def read_header(fp):
+  """Reads the store header, returning a dictionary with its contents or None
+  if the file is not a frame store."""
+
+  data = fp.read(HEADER_SIZE)
+  if len(data) < HEADER_SIZE: return None
+
+  fields = struct.unpack(HEADER, data[:struct.calcsize(HEADER)])
+  if fields[0] != MAGIC: return None
+
+  return dict(zip(('magic', 'version', 'frames', 'height', 'width', 'size',
+    'mtime', 'frame_rate'), fields))
+
+def check(video, store=None):
+  """Checks if the store can be used for the given video.
+
+  Parameters
+
+  video
+    The name of the video file the store was built from
+
+  store
+    The name of the store file. If not set, use the default for the video.
+
+  Returns None if the store is valid, or a string explaining why it is not.
+  """
+
+  if store is None: store = filename(video)
+
+  if not os.path.exists(store):
+    return "'%s' does not exist" % store
+
+  with open(store, 'rb') as fp: header = read_header(fp)
+
+  if header is None:
+    return "'%s' is not a frame store" % store
+  if header['version'] != VERSION:
+    return "'%s' has version %d, but we can only read version %d" % \
+        (store, header['version'], VERSION)
+
+  stat = os.stat(video)
+  if header['size'] != stat.st_size or header['mtime'] != stat.st_mtime:
+    return "'%s' was built from a different version of '%s'" % (store, video)
+
+  expected = HEADER_SIZE + \
+      header['frames'] * 3 * header['height'] * header['width']
+  if os.path.getsize(store) != expected:
+    return "'%s' has %d bytes, but it should have %d" % \
+        (store, os.path.getsize(store), expected)
+
+  return None
+
+def build(video, store=None, callback=None):
+  """Decodes all frames of a video into a store.
+
+  Parameters
+
+  video
+    The name of the video file to decode
+
+  store
+    The name of the store file. If not set, use the default for the video.
+    The file is written under a temporary name and only renamed into place
+    once complete.
+
+  callback
+    If set, called as callback(k, total) after each frame is written
+  """
+
+  import bob
+
+  if store is None: store = filename(video)
+
+  stat = os.stat(video)
+  reader = bob.io.VideoReader(video)
+
+  tmpname = store + '.tmp'
+  with open(tmpname, 'wb') as fp:
+
+    header = struct.pack(HEADER, MAGIC, VERSION, len(reader), reader.height,
+        reader.width, stat.st_size, stat.st_mtime, reader.frame_rate)
+    fp.write(header.ljust(HEADER_SIZE, '\0'))
+
+    for k, frame in enumerate(reader):
+      fp.write(frame.tostring())
+      if callback is not None: callback(k, len(reader))
+
+  os.rename(tmpname, store)
+
+def load(video, store=None):
+  """Memory-maps the frames of a store, read-only.
+
+  Raises a RuntimeError if the store is not valid for the video (see check()).
+  Returns a numpy.memmap with shape (frames, 3, height, width).
+  """
+
+  import numpy
+
+  if store is None: store = filename(video)
+
+  problem = check(video, store)
+  if problem is not None: raise RuntimeError, problem
+
+  with open(store, 'rb') as fp: header = read_header(fp)
+
+  return numpy.memmap(store, dtype='uint8', mode='r', offset=HEADER_SIZE,
+      shape=(header['frames'], 3, header['height'], header['width']))
@@ -32,6 +32,7 @@ setup(
         'replay.py = annotation.video.script.replay:main',
         'postproc.py = annotation.video.script.postproc:main',
         'mktest.py = annotation.video.script.mktest:main',
+        'framestore.py = annotation.video.script.framestore:main',
         ],
       },
 